@@ -1,49 +1,203 @@
+from functools import lru_cache
 from pathlib import Path
-import qdrant_client
-from llama_index.core import VectorStoreIndex, StorageContext, Settings
-from llama_index.embeddings.ollama import OllamaEmbedding 
-from llama_index.llms.ollama import Ollama
-from llama_index.readers.json import JSONReader
-from llama_index.vector_stores.qdrant import QdrantVectorStore
+from typing import TYPE_CHECKING
 import asyncio
+import hashlib
+import json
+import os
+import threading
+import uuid
+
+from metrics import inc, stage
+
+# llama_index and qdrant_client take seconds to import, so they are only
+# loaded when the index is first needed (see get_index)
+if TYPE_CHECKING:
+   from llama_index.core import VectorStoreIndex
+   from llama_index.core.schema import TextNode
+
+# "qdrant" (embedded, single process) or "mmap" (per-contact memory-mapped files, see vectorstore.py)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "qdrant")
+QDRANT_PATH = os.getenv("QDRANT_PATH", "./qdrant_data")
+VECTOR_PATH = os.getenv("VECTOR_PATH", "./vector_data")
+EMBED_DIM = int(os.getenv("EMBED_DIM", 768))
+COLLECTION_NAME = "analysis"
+# Result fields that say how a label was produced rather than what it is; left out of the chunk
+UNINDEXED_FIELDS = ("source", "confidence")
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 32))
+# Same variable the ollama client reads, so analysis and RAG talk to one server
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
 
 prompt = """
 You are an AI designed to analyze communication metadata and generate reply suggestions that perfectly mimic the specified user's typing behavior. Your goal is to provide five distinct reply suggestions for the *last message received*, based on the full context of the conversation.
 
-**The following context is dynamically provided by a RAG (Retrieval-Augmented Generation) system to inform your response:**
+**The conversation context is dynamically provided by a RAG (Retrieval-Augmented Generation) system; the typing profile below is computed from the user's own messages:**
 
 ---
-### **User Typing Behavior Profile (Reign - Retrieved Data):**
-* **Language Mix:** Primarily uses very informal, conversational English with heavy use of internet slang and abbreviations (e.g., 'u', 'l8r', 'sm', 'hw', 'b4', 'dis sem', 'rn', 'lol', 'tru', 'bet', 'ty', 'ily', 'ilyt'). There is no Taglish present in their messages in this context.
-* **Sentence Structure:** Tends to use very short, fragmented sentences or phrases. Responses are concise and direct.
-* **Punctuation & Grammar:** Minimal to no standard punctuation (no periods, commas, or proper capitalization at the start of sentences). Uses multiple question marks or exclamation points for emphasis.
-* **Emoji Usage:** Uses emojis consistently to convey emotion or add emphasis. Specific emojis observed: 😩, 💀, 👀, 😭.
-* **Common Phrases/Slang:** "idk yet," "got sm hw," "b4 i flop," "bet!", "i'll pull up," "ty," "ily."
-* **Tone:** Casual, informal, friendly, sometimes a bit stressed (😩) or dramatic (💀, 😭), and enthusiastic ("bet!").
-* **Typing Quirks:** Uses numbers for letters ('2', '4'), heavy use of initialisms and internet abbreviations.
+{profile}
 
 ---
 Reply to the last message
 """
 
-async def suggesitonGeneration():
-   Settings.llm = Ollama(model="gemma3:4b", request_timeout=1000)
+# Only this part is embedded for retrieval, so its embedding stays cacheable
+# while the profile in the prompt changes from contact to contact
+RETRIEVAL_QUERY = "Reply to the last message received in the conversation"
+
+DEFAULT_PROFILE = "### **User Typing Behavior Profile:**\n* No profile available; use a neutral, casual tone."
+
+_index: "VectorStoreIndex | None" = None
+_index_lock = threading.Lock()
+# Local Qdrant persists every upsert through one sqlite connection, which is not safe across threads
+# (the mmap backend locks its own files, this just keeps the check-then-insert together)
+_write_lock = threading.Lock()
+
+def get_index() -> "VectorStoreIndex":
+   """Index over the existing vector store, opened once per process on first use"""
+   global _index
+   with _index_lock:
+      if _index is None:
+         from llama_index.core import VectorStoreIndex, Settings
+         from llama_index.embeddings.ollama import OllamaEmbedding
+         from llama_index.llms.ollama import Ollama
+
+         Settings.llm = Ollama(model="gemma3:4b", base_url=OLLAMA_HOST, request_timeout=1000)
+         Settings.embed_model = OllamaEmbedding(model_name='nomic-embed-text:latest', base_url=OLLAMA_HOST,
+                                                embed_batch_size=EMBED_BATCH_SIZE)
+
+         _index = VectorStoreIndex.from_vector_store(open_vector_store())
+   return _index
+
+def open_vector_store():
+   if VECTOR_BACKEND == "mmap":
+      from vectorstore import MmapVectorStore
+
+      return MmapVectorStore(VECTOR_PATH, dim=EMBED_DIM)
+   if VECTOR_BACKEND != "qdrant":
+      raise ValueError(f"Unknown VECTOR_BACKEND: {VECTOR_BACKEND}")
+
+   import qdrant_client
+   from llama_index.vector_stores.qdrant import QdrantVectorStore
+
+   client = qdrant_client.QdrantClient(path=QDRANT_PATH)
+   return QdrantVectorStore(client=client, collection_name=COLLECTION_NAME)
+
+def analysis_node(result: dict, contact_id: int | None) -> "TextNode":
+   """One node per analyzed message, keyed by (contact, message id), with a hash of its content.
+
+   Re-labelling or editing a message keeps the id and changes the hash, so the
+   old node is replaced instead of piling up next to the new one.
+   """
+   from llama_index.core.schema import TextNode
 
-   Settings.embed_model = OllamaEmbedding(model_name='nomic-embed-text:latest')
+   # Where the emotion came from (cache, lexicon, LLM) must not change the chunk
+   content = {key: value for key, value in result.items() if key not in UNINDEXED_FIELDS}
+   text = json.dumps(content, ensure_ascii=False, sort_keys=True)
+   digest = hashlib.sha256(f"{contact_id}\0{text}".encode("utf-8")).hexdigest()
+   # Results without a message id (e.g. from a plain list of texts) can only be keyed by content
+   key = digest if result.get("id") is None else hashlib.sha256(f"{contact_id}\0{result['id']}".encode("utf-8")).hexdigest()
+   return TextNode(
+      id_=str(uuid.UUID(key[:32])),
+      text=text,
+      metadata={"contact_id": contact_id, "content_hash": digest},
+      excluded_embed_metadata_keys=["contact_id", "content_hash"],
+      excluded_llm_metadata_keys=["contact_id", "content_hash"],
+   )
 
-   loader = JSONReader()
-   documents = loader.load_data(Path(r'C:\Users\John Carlo\telegram\Backend\saved_messages\reign_analysis.json'))
+def stored_hashes(ids: list[str], contact_id: int | None = None) -> dict[str, str | None]:
+   """content_hash of each of `ids` already in the index; absent ids are left out"""
+   vector_store = get_index().vector_store
+   if VECTOR_BACKEND == "mmap":
+      return vector_store.stored_hashes(ids, contact_id)
 
-   client = qdrant_client.QdrantClient(path="./qdrant_data")
-   vector_store = QdrantVectorStore(client=client, collection_name="analysis")
-   storage_context = StorageContext.from_defaults(vector_store=vector_store)
+   if not vector_store.client.collection_exists(COLLECTION_NAME):
+      return {}
 
-   index = VectorStoreIndex.from_documents(documents, storage_context=storage_context)
+   found = {}
+   for start in range(0, len(ids), 256):
+      with stage("qdrant_retrieve"):
+         records = vector_store.client.retrieve(
+            COLLECTION_NAME, ids=ids[start:start + 256], with_payload=["content_hash"], with_vectors=False
+         )
+      found.update((str(record.id), (record.payload or {}).get("content_hash")) for record in records)
+   return found
+
+def index_analysis(results: list[dict], contact_id: int | None = None) -> int:
+   """Upsert analysis results; only new messages and ones whose content changed are embedded"""
+   nodes = {node.id_: node for node in (analysis_node(result, contact_id) for result in results)}
+   with _write_lock:
+      stored = stored_hashes(list(nodes), contact_id)
+      changed = [node_id for node_id, node in nodes.items()
+                 if node_id in stored and stored[node_id] != node.metadata["content_hash"]]
+      new_nodes = [node for node_id, node in nodes.items() if node_id not in stored or node_id in changed]
+      if changed:
+         get_index().vector_store.delete_nodes(changed)
+      if new_nodes:
+         # Embedding happens here, batched by EMBED_BATCH_SIZE, followed by the upsert
+         with stage("embed_index"):
+            get_index().insert_nodes(new_nodes)
+         inc("embedded_nodes_total", len(new_nodes))
+   return len(new_nodes)
+
+@lru_cache(maxsize=32)
+def query_embedding(text: str) -> tuple[float, ...]:
+   from llama_index.core import Settings
+
+   get_index()
+   with stage("embed_query"):
+      return tuple(Settings.embed_model.get_query_embedding(text))
+
+def load_analysis(path: Path) -> list[dict]:
+   with open(path, "r", encoding="utf-8") as f:
+      return json.load(f)
+
+async def _query(contact_id: int | None, analysis_path: Path | None, streaming: bool, profile: str | None):
+   from llama_index.core import get_response_synthesizer
+   from llama_index.core.schema import QueryBundle
+   from llama_index.core.vector_stores import MetadataFilters, ExactMatchFilter
+
+   index = await asyncio.to_thread(get_index)
+
+   if analysis_path is not None:
+      added = await asyncio.to_thread(index_analysis, load_analysis(analysis_path), contact_id)
+      print(f"Indexed {added} new analysis chunks")
+
+   filters = None
+   if contact_id is not None:
+      filters = MetadataFilters(filters=[ExactMatchFilter(key="contact_id", value=contact_id)])
+   bundle = QueryBundle(
+      query_str=prompt.format(profile=profile or DEFAULT_PROFILE),
+      custom_embedding_strs=[RETRIEVAL_QUERY],
+      embedding=list(await asyncio.to_thread(query_embedding, RETRIEVAL_QUERY)),
+   )
+
+   # What index.as_query_engine().query does, split so retrieval and generation are timed apart
+   with stage("vector_query", backend=VECTOR_BACKEND):
+      nodes = await asyncio.to_thread(index.as_retriever(filters=filters).retrieve, bundle)
+   synthesizer = get_response_synthesizer(streaming=streaming)
+   if streaming:
+      # Tokens are only generated as the stream is read, so that is what gets timed
+      return await asyncio.to_thread(synthesizer.synthesize, bundle, nodes)
+   with stage("suggestion", streaming="false"):
+      return await asyncio.to_thread(synthesizer.synthesize, bundle, nodes)
+
+async def suggesitonGeneration(contact_id: int | None = None, analysis_path: Path | None = None,
+                               profile: str | None = None) -> str:
+   """Reply suggestions for a contact, optionally indexing a fresh analysis file first"""
+   response = await _query(contact_id, analysis_path, streaming=False, profile=profile)
 
-   query_engine = index.as_query_engine()
-   response = query_engine.query(prompt)
-   
    print(response)
-   
+   return str(response)
+
+async def suggestion_stream(contact_id: int | None = None, profile: str | None = None):
+   """Same as suggesitonGeneration, but returns a (blocking) generator of LLM tokens as they arrive"""
+   response = await _query(contact_id, None, streaming=True, profile=profile)
+   return timed_tokens(response.response_gen)
+
+def timed_tokens(tokens):
+   with stage("suggestion", streaming="true"):
+      yield from tokens
+
 
-asyncio.run(suggesitonGeneration())
\ No newline at end of file
+if __name__ == "__main__":
+   asyncio.run(suggesitonGeneration(analysis_path=Path(__file__).parent / "saved_messages" / "reign_analysis.json"))
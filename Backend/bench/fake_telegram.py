@@ -0,0 +1,127 @@
+import asyncio
+import random
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from telethon.tl.functions.contacts import ImportContactsRequest
+from telethon.tl.types import InputPeerUser
+
+# Phones of the synthetic contacts are PHONE_BASE + index, without the +63 prefix
+PHONE_BASE = 9_000_000_000
+USER_ID_BASE = 100_000
+
+WORDS = [
+    "hey", "so", "i", "you", "we", "think", "the", "meeting", "tomorrow", "dinner", "later", "work", "home",
+    "really", "maybe", "just", "got", "back", "from", "class", "need", "to", "finish", "this", "report",
+    "movie", "weekend", "call", "me", "when", "free", "sorry", "late", "again", "traffic", "was", "bad",
+    "love", "that", "idea", "can't", "wait", "miss", "old", "days", "what", "time", "is", "it", "now",
+]
+SLANG = ["lol", "u", "rn", "idk", "tbh", "omg", "b4", "l8r", "gonna", "ngl", "fr", "thx"]
+EMOJI = ["😂", "😭", "❤️", "👍", "🙏", "😅", "🔥"]
+ENDINGS = ["", "", ".", "?", "!", "!!", "??"]
+
+
+def synthetic_text(rng: random.Random) -> str:
+    words = rng.choices(WORDS, k=rng.randint(1, 18))
+    for _ in range(rng.randint(0, 2)):
+        words.insert(rng.randrange(len(words) + 1), rng.choice(SLANG))
+    text = " ".join(words)
+    if rng.random() < 0.4:
+        text = text[0].upper() + text[1:]
+    text += rng.choice(ENDINGS)
+    if rng.random() < 0.2:
+        text += " " + rng.choice(EMOJI)
+    # A random tag keeps texts distinct, so the emotion cache is only hit by real repeats
+    return f"{text} #{rng.getrandbits(32):08x}"
+
+
+class Conversations:
+    """Deterministic synthetic chats: `contacts` users with `messages` messages each"""
+
+    def __init__(self, contacts: int = 4, messages: int = 1000, seed: int = 0):
+        self.contacts = contacts
+        self.messages = messages
+        self.seed = seed
+        self._chats: dict[int, list[SimpleNamespace]] = {}
+
+    def user(self, index: int) -> SimpleNamespace:
+        return SimpleNamespace(id=USER_ID_BASE + index, access_hash=index, first_name="Contact", last_name=str(index))
+
+    def index_of(self, phone: str) -> int | None:
+        digits = phone.removeprefix("+63")
+        index = int(digits) - PHONE_BASE if digits.isdigit() else -1
+        return index if 0 <= index < self.contacts else None
+
+    def chat(self, user_id: int) -> list[SimpleNamespace]:
+        """Messages oldest first, ids 1..n, built on first access"""
+        if user_id not in self._chats:
+            rng = random.Random(self.seed * 1_000_003 + user_id)
+            start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+            self._chats[user_id] = [
+                SimpleNamespace(id=i, out=rng.random() < 0.5, date=start + timedelta(minutes=7 * i),
+                                text=synthetic_text(rng))
+                for i in range(1, self.messages + 1)
+            ]
+        return self._chats[user_id]
+
+
+class FakeTelegramClient:
+    """Stands in for TelegramClient with just the calls the backend makes.
+
+    Every API round trip (a connect, an import, one page of 100 messages)
+    sleeps `latency` seconds so network cost shows up in the timings.
+    """
+
+    def __init__(self, conversations: Conversations, latency: float = 0.05):
+        self.conversations = conversations
+        self.latency = latency
+
+    async def connect(self):
+        await asyncio.sleep(self.latency)
+
+    async def disconnect(self):
+        pass
+
+    async def is_user_authorized(self) -> bool:
+        return True
+
+    async def get_me(self):
+        await asyncio.sleep(self.latency)
+        return SimpleNamespace(id=1, first_name="Bench", last_name="User")
+
+    async def get_input_entity(self, user_id: int) -> InputPeerUser:
+        return InputPeerUser(user_id, user_id - USER_ID_BASE)
+
+    def add_event_handler(self, callback, event=None):
+        pass
+
+    def remove_event_handler(self, callback, event=None):
+        pass
+
+    async def __call__(self, request):
+        if not isinstance(request, ImportContactsRequest):
+            raise NotImplementedError(f"FakeTelegramClient does not handle {type(request).__name__}")
+
+        await asyncio.sleep(self.latency)
+        users, imported = [], []
+        for contact in request.contacts:
+            index = self.conversations.index_of(contact.phone)
+            if index is None:
+                continue
+            user = self.conversations.user(index)
+            users.append(user)
+            imported.append(SimpleNamespace(user_id=user.id, client_id=contact.client_id))
+        return SimpleNamespace(users=users, imported=imported, retry_contacts=[])
+
+    async def iter_messages(self, peer, limit: int | None = None, min_id: int = 0, offset_id: int = 0):
+        """Newest first, with Telethon's exclusive min_id / offset_id bounds"""
+        chat = self.conversations.chat(peer.user_id)
+        high = len(chat) if not offset_id else min(offset_id - 1, len(chat))
+        sent = 0
+        for message in reversed(chat[min_id:high]):
+            if limit is not None and sent >= limit:
+                return
+            if sent % 100 == 0:
+                await asyncio.sleep(self.latency)
+            yield message
+            sent += 1
@@ -0,0 +1,162 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import re
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+from aiohttp import web
+
+from chatInference import BATCH_SYSTEM_PROMPT, EMOTIONS, SYSTEM_PROMPT
+
+EMBED_DIM = 768
+EMOTION_LIST = sorted(EMOTIONS)
+SUGGESTION = ("1. haha ok see u l8r\n2. omg yes!!\n3. idk tbh, maybe tmrw?\n"
+              "4. sure, call me when ur free\n5. lol same")
+
+
+class OllamaStub:
+    """Answers Ollama's chat, generate and embeddings APIs with canned output.
+
+    Each reply waits `latency` seconds before the first token and then
+    produces `tokens_per_second` tokens, so it costs about what a real model
+    would. A fraction of replies (`malformed`) is not valid JSON, to exercise
+    the retry path.
+    """
+
+    def __init__(self, latency: float = 0.2, tokens_per_second: float = 200.0, embed_latency: float = 0.01,
+                 malformed: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.embed_latency = embed_latency
+        self.malformed = malformed
+        self.rng = np.random.default_rng(seed)
+        self.requests = {"chat": 0, "generate": 0, "embeddings": 0}
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/api/chat", self.chat)
+        app.router.add_post("/api/generate", self.generate)
+        app.router.add_post("/api/embeddings", self.embeddings)
+        app.router.add_post("/api/embed", self.embed)
+        app.router.add_post("/api/show", self.show)
+        app.router.add_get("/api/tags", self.tags)
+        app.router.add_get("/stats", self.stats)
+        return app
+
+    # --- Canned output ---------------------------------------------------------
+
+    def emotion(self, text: str) -> dict:
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        return {"analysis": "Synthetic benchmark label", "dim": EMOTION_LIST[digest[0] % len(EMOTION_LIST)],
+                "score": round(digest[1] / 25.5, 1)}
+
+    def reply(self, messages: list[dict]) -> str:
+        system = next((m["content"] for m in messages if m.get("role") == "system"), "")
+        user = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+        if self.rng.random() < self.malformed:
+            return "Sorry, I cannot classify that."
+        if system == BATCH_SYSTEM_PROMPT:
+            items = []
+            for line in user.splitlines():
+                index, _, text = line.partition(": ")
+                if index.isdigit():
+                    items.append({"index": int(index), **self.emotion(text)})
+            return json.dumps(items)
+        if system == SYSTEM_PROMPT:
+            return json.dumps([self.emotion(user)])
+        return SUGGESTION
+
+    def vector(self, text: str) -> list[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        v = np.random.default_rng(seed).standard_normal(EMBED_DIM)
+        return (v / np.linalg.norm(v)).tolist()
+
+    # --- Handlers --------------------------------------------------------------
+
+    async def _answer(self, request: web.Request, body: dict, text: str, wrap) -> web.StreamResponse:
+        tokens = re.findall(r"\S+\s*|\s+", text)
+        per_token = 1 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+        started = time.perf_counter()
+        await asyncio.sleep(self.latency)
+
+        done = {
+            "model": body.get("model", ""), "created_at": _now(), "done": True, "done_reason": "stop",
+            "eval_count": len(tokens), "eval_duration": int(per_token * len(tokens) * 1e9), "prompt_eval_count": 0,
+        }
+        if not body.get("stream", True):
+            await asyncio.sleep(per_token * len(tokens))
+            done["total_duration"] = int((time.perf_counter() - started) * 1e9)
+            return web.json_response({**done, **wrap(text)})
+
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        for token in tokens:
+            await asyncio.sleep(per_token)
+            chunk = {"model": body.get("model", ""), "created_at": _now(), "done": False, **wrap(token)}
+            await response.write((json.dumps(chunk) + "\n").encode("utf-8"))
+        done["total_duration"] = int((time.perf_counter() - started) * 1e9)
+        await response.write((json.dumps({**done, **wrap("")}) + "\n").encode("utf-8"))
+        await response.write_eof()
+        return response
+
+    async def chat(self, request: web.Request) -> web.StreamResponse:
+        self.requests["chat"] += 1
+        body = await request.json()
+        return await self._answer(request, body, self.reply(body.get("messages", [])),
+                                  lambda text: {"message": {"role": "assistant", "content": text}})
+
+    async def generate(self, request: web.Request) -> web.StreamResponse:
+        self.requests["generate"] += 1
+        body = await request.json()
+        messages = [{"role": "system", "content": body.get("system", "")},
+                    {"role": "user", "content": body.get("prompt", "")}]
+        return await self._answer(request, body, self.reply(messages), lambda text: {"response": text})
+
+    async def embeddings(self, request: web.Request) -> web.Response:
+        self.requests["embeddings"] += 1
+        body = await request.json()
+        await asyncio.sleep(self.embed_latency)
+        return web.json_response({"embedding": self.vector(body.get("prompt", ""))})
+
+    async def embed(self, request: web.Request) -> web.Response:
+        self.requests["embeddings"] += 1
+        body = await request.json()
+        inputs = body.get("input", [])
+        inputs = [inputs] if isinstance(inputs, str) else inputs
+        await asyncio.sleep(self.embed_latency)
+        return web.json_response({"model": body.get("model", ""), "embeddings": [self.vector(t) for t in inputs]})
+
+    async def show(self, request: web.Request) -> web.Response:
+        return web.json_response({"modelfile": "", "parameters": "", "template": "", "details": {},
+                                  "model_info": {"general.context_length": 8192}})
+
+    async def tags(self, request: web.Request) -> web.Response:
+        return web.json_response({"models": []})
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.requests)
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Ollama HTTP API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--latency-ms", type=float, default=200, help="delay before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=200)
+    parser.add_argument("--embed-latency-ms", type=float, default=10)
+    parser.add_argument("--malformed", type=float, default=0.0, help="fraction of replies that are not JSON")
+    args = parser.parse_args()
+
+    stub = OllamaStub(args.latency_ms / 1000, args.tokens_per_second, args.embed_latency_ms / 1000, args.malformed)
+    web.run_app(stub.app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
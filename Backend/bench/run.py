@@ -0,0 +1,216 @@
+# Usage, from Backend/:  python -m bench.run --contacts 4 --messages 2000 --concurrency 8 --json out.json
+# Starts the Ollama stub and the backend (with a fake Telegram account) as subprocesses,
+# then measures each endpoint and the backend's peak memory.
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+import numpy as np
+
+from bench.fake_telegram import PHONE_BASE, USER_ID_BASE
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+ENDPOINTS = ("messages", "generate", "suggestion")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def memory_kb(pid: int) -> dict:
+    """Current and peak resident set size of a process, from /proc (Linux only)"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+    except OSError:
+        return {}
+    return {"rss_kb": int(fields["VmRSS"].split()[0]), "peak_rss_kb": int(fields["VmHWM"].split()[0])}
+
+
+async def wait_ready(client: httpx.AsyncClient, timeout: float = 120.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/ready")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"Backend not ready after {timeout:.0f}s")
+
+
+async def timed(client: httpx.AsyncClient, method: str, url: str, **kwargs) -> dict:
+    """One request, read to the end; records time to first byte and total time"""
+    started = time.perf_counter()
+    first_byte = None
+    body = bytearray()
+    try:
+        async with client.stream(method, url, **kwargs) as response:
+            async for chunk in response.aiter_bytes():
+                if first_byte is None:
+                    first_byte = time.perf_counter() - started
+                body += chunk
+        ok = response.is_success
+        if ok and response.headers.get("content-type", "").startswith("application/json"):
+            payload = json.loads(body)
+            ok = not (isinstance(payload, dict) and "error" in payload)
+    except httpx.HTTPError:
+        ok = False
+    total = time.perf_counter() - started
+    return {"ok": ok, "seconds": total, "ttfb": first_byte if first_byte is not None else total}
+
+
+async def run_phase(client: httpx.AsyncClient, name: str, requests: list[tuple], concurrency: int) -> dict:
+    queue = list(reversed(requests))
+    samples = []
+
+    async def worker():
+        while queue:
+            method, url, kwargs = queue.pop()
+            samples.append(await timed(client, method, url, **kwargs))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, len(requests)))))
+    elapsed = time.perf_counter() - started
+    return summarize(name, samples, elapsed)
+
+
+def summarize(name: str, samples: list[dict], elapsed: float) -> dict:
+    ok = [s for s in samples if s["ok"]]
+    latency = np.array([s["seconds"] for s in ok]) * 1000
+    ttfb = np.array([s["ttfb"] for s in ok]) * 1000
+    summary = {"phase": name, "requests": len(samples), "errors": len(samples) - len(ok),
+               "seconds": round(elapsed, 3), "throughput": round(len(ok) / elapsed, 2) if elapsed else 0.0}
+    if len(ok):
+        p50, p95, p99 = np.percentile(latency, [50, 95, 99])
+        summary.update(p50_ms=round(p50, 1), p95_ms=round(p95, 1), p99_ms=round(p99, 1),
+                       ttfb_p50_ms=round(float(np.percentile(ttfb, 50)), 1))
+    return summary
+
+
+def print_table(phases: list[dict], memory: dict):
+    columns = ["phase", "requests", "errors", "throughput", "p50_ms", "p95_ms", "p99_ms", "ttfb_p50_ms"]
+    widths = [max(len(c), *(len(str(p.get(c, "-"))) for p in phases)) for c in columns]
+    print("  ".join(c.rjust(w) for c, w in zip(columns, widths)))
+    for phase in phases:
+        print("  ".join(str(phase.get(c, "-")).rjust(w) for c, w in zip(columns, widths)))
+    if memory:
+        print(f"backend RSS after startup {memory['ready_rss_kb'] / 1024:.1f} MiB, "
+              f"peak {memory['peak_rss_kb'] / 1024:.1f} MiB")
+
+
+async def benchmark(args, base_url: str, server: subprocess.Popen) -> dict:
+    contacts = range(args.contacts)
+    phones = [str(PHONE_BASE + i) for i in contacts]
+    user_ids = [USER_ID_BASE + i for i in contacts]
+    pages = args.messages // 100 + 1
+
+    limits = httpx.Limits(max_connections=args.concurrency * 2)
+    async with httpx.AsyncClient(base_url=base_url, timeout=None, limits=limits) as client:
+        await wait_ready(client)
+        memory = {"ready_rss_kb": memory_kb(server.pid).get("rss_kb")}
+        phases = []
+
+        # Full history sync is always needed; the other phases work on the synced chats
+        phases.append(await run_phase(client, "sync", [
+            ("POST", "/messages", {"json": {"phone": phone, "limit": 1, "backfill_pages": pages}})
+            for phone in phones
+        ], args.concurrency))
+
+        if "messages" in args.endpoints:
+            phases.append(await run_phase(client, "messages", [
+                ("POST", "/messages", {"json": {"phone": phones[i % len(phones)], "limit": 50}})
+                for i in range(args.requests)
+            ], args.concurrency))
+
+        if "generate" in args.endpoints:
+            # The first pass per contact goes to the LLM, later ones mostly hit the emotion cache
+            phases.append(await run_phase(client, "generate (cold)", [
+                ("GET", "/generate", {"params": {"contact_id": user_id}}) for user_id in user_ids
+            ], args.concurrency))
+            phases.append(await run_phase(client, "generate", [
+                ("GET", "/generate", {"params": {"contact_id": user_ids[i % len(user_ids)]}})
+                for i in range(args.requests)
+            ], args.concurrency))
+
+        if "suggestion" in args.endpoints:
+            phases.append(await run_phase(client, "suggestion", [
+                ("GET", "/suggestion", {"params": {"contact_id": user_ids[i % len(user_ids)], "stream": True}})
+                for i in range(args.requests)
+            ], args.concurrency))
+
+        memory.update(peak_rss_kb=memory_kb(server.pid).get("peak_rss_kb"))
+    return {"phases": phases, "memory": memory if memory["peak_rss_kb"] else {}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the backend against fake Telegram and Ollama")
+    parser.add_argument("--contacts", type=int, default=4)
+    parser.add_argument("--messages", type=int, default=1000, help="messages per synthetic chat")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=40, help="requests per measured phase")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help="comma-separated subset of " + ", ".join(ENDPOINTS))
+    parser.add_argument("--llm-latency-ms", type=float, default=200, help="stub delay before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=200)
+    parser.add_argument("--embed-latency-ms", type=float, default=10)
+    parser.add_argument("--malformed", type=float, default=0.0, help="fraction of stub replies that are not JSON")
+    parser.add_argument("--telegram-latency-ms", type=float, default=50)
+    parser.add_argument("--vector-backend", default="qdrant", choices=["qdrant", "mmap"])
+    parser.add_argument("--workdir", help="keep the database, index and analysis files here instead of a temp dir")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+    args.endpoints = [e.strip() for e in args.endpoints.split(",") if e.strip()]
+
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix="bench-"))
+    (workdir / "saved_messages").mkdir(parents=True, exist_ok=True)
+    stub_port, backend_port = free_port(), free_port()
+
+    env = {
+        **os.environ,
+        "PYTHONPATH": os.pathsep.join(filter(None, [str(BACKEND_DIR), os.environ.get("PYTHONPATH")])),
+        "OLLAMA_HOST": f"http://127.0.0.1:{stub_port}",
+        "MESSAGE_DB": str(workdir / "messages.db"),
+        "QDRANT_PATH": str(workdir / "qdrant_data"),
+        "VECTOR_BACKEND": args.vector_backend,
+        "VECTOR_PATH": str(workdir / "vector_data"),
+        "TELEGRAM_SESSIONS": "bench",
+        "INGEST": "0",
+    }
+    stub = subprocess.Popen([
+        sys.executable, "-m", "bench.ollama_stub", "--port", str(stub_port),
+        "--latency-ms", str(args.llm_latency_ms), "--tokens-per-second", str(args.tokens_per_second),
+        "--embed-latency-ms", str(args.embed_latency_ms), "--malformed", str(args.malformed),
+    ], cwd=workdir, env=env)
+    server = subprocess.Popen([
+        sys.executable, "-m", "bench.serve", "--port", str(backend_port), "--contacts", str(args.contacts),
+        "--messages", str(args.messages), "--telegram-latency-ms", str(args.telegram_latency_ms),
+    ], cwd=workdir, env=env, stdout=subprocess.DEVNULL)
+
+    try:
+        results = asyncio.run(benchmark(args, f"http://127.0.0.1:{backend_port}", server))
+    finally:
+        for process in (server, stub):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    print_table(results["phases"], results["memory"])
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), **results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+import argparse
+
+import uvicorn
+
+import main as backend
+from bench.fake_telegram import Conversations, FakeTelegramClient
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the backend against a fake Telegram account")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--contacts", type=int, default=4)
+    parser.add_argument("--messages", type=int, default=1000, help="messages per synthetic chat")
+    parser.add_argument("--telegram-latency-ms", type=float, default=50, help="cost of one Telegram round trip")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    conversations = Conversations(args.contacts, args.messages, args.seed)
+    latency = args.telegram_latency_ms / 1000
+    backend.pool.client_factory = lambda session, api_id, api_hash: FakeTelegramClient(conversations, latency)
+    uvicorn.run(backend.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+# Usage, from Backend/:  python -m bench.vectors --contacts 20 --nodes 2000 --queries 500
+# Builds the same synthetic analysis index with each vector backend in a fresh
+# process and compares build time, filtered query latency and memory.
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from bench.run import memory_kb
+
+BACKENDS = ("qdrant", "mmap")
+
+
+def synthetic_nodes(contacts: int, per_contact: int, dim: int, seed: int) -> list:
+    from RAGPipeline import analysis_node
+
+    rng = np.random.default_rng(seed)
+    nodes = []
+    for contact in range(contacts):
+        for i in range(per_contact):
+            node = analysis_node({"id": i, "text": f"message {i} of contact {contact}", "timestamp": None,
+                                  "emotion": "neutral", "score": 5.0, "analysis": "synthetic"}, contact)
+            node.embedding = rng.standard_normal(dim, dtype=np.float32).tolist()
+            nodes.append(node)
+    return nodes
+
+
+def open_store(backend: str, path: str, dim: int):
+    if backend == "mmap":
+        from vectorstore import MmapVectorStore
+
+        return MmapVectorStore(path, dim=dim)
+
+    import qdrant_client
+    from llama_index.vector_stores.qdrant import QdrantVectorStore
+
+    return QdrantVectorStore(client=qdrant_client.QdrantClient(path=path), collection_name="analysis")
+
+
+def measure(args) -> dict:
+    """One backend, in this process: build, then time filtered top-k queries"""
+    from llama_index.core.vector_stores import ExactMatchFilter, MetadataFilters, VectorStoreQuery
+
+    nodes = synthetic_nodes(args.contacts, args.nodes, args.dim, args.seed)
+    store = open_store(args.backend, args.path, args.dim)
+
+    started = time.perf_counter()
+    for start in range(0, len(nodes), args.batch_size):
+        store.add(nodes[start:start + args.batch_size])
+    build = time.perf_counter() - started
+    del nodes
+
+    # Query the mmap store through a fresh instance, as another worker would see it;
+    # embedded Qdrant holds a lock on its directory, so it keeps the one it built with
+    store = open_store(args.backend, args.path, args.dim) if args.backend == "mmap" else store
+    rng = np.random.default_rng(args.seed + 1)
+    latencies = []
+    for _ in range(args.queries):
+        contact = int(rng.integers(args.contacts))
+        query = VectorStoreQuery(
+            query_embedding=rng.standard_normal(args.dim, dtype=np.float32).tolist(),
+            similarity_top_k=args.top_k,
+            filters=MetadataFilters(filters=[ExactMatchFilter(key="contact_id", value=contact)]),
+        )
+        started = time.perf_counter()
+        result = store.query(query)
+        latencies.append((time.perf_counter() - started) * 1000)
+        assert len(result.ids) == min(args.top_k, args.nodes)
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    memory = memory_kb(os.getpid())
+    return {
+        "backend": args.backend,
+        "vectors": args.contacts * args.nodes,
+        "build_s": round(build, 2),
+        "query_p50_ms": round(p50, 2), "query_p95_ms": round(p95, 2), "query_p99_ms": round(p99, 2),
+        "rss_mib": round(memory.get("rss_kb", 0) / 1024, 1),
+        "peak_rss_mib": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the Qdrant and memory-mapped vector backends")
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--contacts", type=int, default=20)
+    parser.add_argument("--nodes", type=int, default=2000, help="vectors per contact")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=2, help="llama-index's default similarity_top_k")
+    parser.add_argument("--batch-size", type=int, default=32, help="nodes per add, like insert_nodes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the results to this file")
+    # Internal: run a single backend in this process
+    parser.add_argument("--backend", help=argparse.SUPPRESS)
+    parser.add_argument("--path", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.backend:
+        print(json.dumps(measure(args)))
+        return
+
+    results = []
+    for backend in [b.strip() for b in args.backends.split(",") if b.strip()]:
+        path = tempfile.mkdtemp(prefix=f"bench-{backend}-")
+        command = [sys.executable, "-m", "bench.vectors", "--backend", backend, "--path", path,
+                   "--contacts", str(args.contacts), "--nodes", str(args.nodes), "--dim", str(args.dim),
+                   "--queries", str(args.queries), "--top-k", str(args.top_k),
+                   "--batch-size", str(args.batch_size), "--seed", str(args.seed)]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    columns = list(results[0])
+    widths = [max(len(c), *(len(str(r[c])) for r in results)) for c in columns]
+    print("  ".join(c.rjust(w) for c, w in zip(columns, widths)))
+    for result in results:
+        print("  ".join(str(result[c]).rjust(w) for c, w in zip(columns, widths)))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import hashlib
+import os
+import time
+
+import aiosqlite
+
+from store import DB_PATH
+
+EMOTION_CACHE_SIZE = int(os.getenv('EMOTION_CACHE_SIZE', 200_000))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS emotion_cache (
+    key TEXT PRIMARY KEY,
+    text TEXT NOT NULL,
+    model TEXT NOT NULL,
+    dim TEXT NOT NULL,
+    score REAL NOT NULL,
+    analysis TEXT NOT NULL,
+    used_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS emotion_cache_used_at ON emotion_cache (used_at);
+"""
+
+
+def cache_key(text: str, model: str, prompt_version: str) -> str:
+    return hashlib.sha256(f"{model}\0{prompt_version}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmotionCache:
+    """Persistent emotion results keyed by hash(text, model, prompt version).
+
+    Changing the model or the prompt changes every key, so stale entries are
+    never served; they simply age out of the least-recently-used eviction.
+    """
+
+    def __init__(self, path: str = DB_PATH, max_entries: int = EMOTION_CACHE_SIZE):
+        self.path = path
+        self.max_entries = max_entries
+        self.db: aiosqlite.Connection | None = None
+        self.hits = 0
+        self.misses = 0
+
+    async def open(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.db = await aiosqlite.connect(self.path)
+        await self.db.execute("PRAGMA journal_mode=WAL")
+        await self.db.executescript(SCHEMA)
+        await self.db.commit()
+
+    async def close(self):
+        if self.db is not None:
+            await self.db.close()
+            self.db = None
+
+    async def get_many(self, texts: list[str], model: str, prompt_version: str) -> list[dict | None]:
+        """Cached emotion for each text, or None on a miss."""
+        keys = [cache_key(text, model, prompt_version) for text in texts]
+        found = {}
+        # Stay well under SQLite's bound-parameter limit
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            async with self.db.execute(
+                f"SELECT key, dim, score, analysis FROM emotion_cache WHERE key IN ({placeholders})", chunk
+            ) as cur:
+                for key, dim, score, analysis in await cur.fetchall():
+                    found[key] = {"dim": dim, "score": score, "analysis": analysis, "source": "cache"}
+
+        if found:
+            now = time.time()
+            await self.db.executemany(
+                "UPDATE emotion_cache SET used_at = ? WHERE key = ?", [(now, key) for key in found]
+            )
+            await self.db.commit()
+
+        results = [found.get(key) for key in keys]
+        hits = sum(result is not None for result in results)
+        self.hits += hits
+        self.misses += len(results) - hits
+        return results
+
+    async def put_many(self, items: list[tuple[str, dict]], model: str, prompt_version: str):
+        """Store (text, emotion) pairs and evict the least recently used overflow."""
+        if not items:
+            return
+        now = time.time()
+        await self.db.executemany(
+            "INSERT OR REPLACE INTO emotion_cache (key, text, model, dim, score, analysis, used_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (cache_key(text, model, prompt_version), text, model,
+                 emotion["dim"], emotion["score"], emotion["analysis"], now)
+                for text, emotion in items
+            ],
+        )
+        await self.db.execute(
+            "DELETE FROM emotion_cache WHERE key IN ("
+            "SELECT key FROM emotion_cache ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+        await self.db.commit()
+
+    async def labelled(self, model: str, limit: int = 20_000) -> list[tuple[str, str, float]]:
+        """Most recently used (text, emotion, score) labels produced by `model`."""
+        async with self.db.execute(
+            "SELECT text, dim, score FROM emotion_cache WHERE model = ? ORDER BY used_at DESC LIMIT ?",
+            (model, limit),
+        ) as cur:
+            return [tuple(row) for row in await cur.fetchall()]
+
+    async def size(self) -> int:
+        async with self.db.execute("SELECT COUNT(*) FROM emotion_cache") as cur:
+            (total,) = await cur.fetchone()
+        return total
+
+    async def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": await self.size(),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -1,8 +1,15 @@
 import re
-from ollama import AsyncClient
 import asyncio
+import hashlib
 import json
 import os
+import time
+from typing import TYPE_CHECKING
+
+from metrics import inc, stage
+
+if TYPE_CHECKING:
+    from ollama import AsyncClient
 
 SYSTEM_PROMPT = """
 **MANDATORY EMOTION LIST - ONLY THESE 28 ALLOWED:**
@@ -47,40 +54,484 @@ Response: [{"analysis": "Text expresses strong positive reaction", "dim": "joy",
 - No extra text before or after the JSON
 """
 
+BATCH_SYSTEM_PROMPT = """
+**MANDATORY EMOTION LIST - ONLY THESE 28 ALLOWED:**
+
+1. admiration    2. amusement     3. anger         4. annoyance     5. approval
+6. caring        7. confusion     8. curiosity     9. desire        10. disappointment
+11. disapproval  12. disgust      13. embarrassment 14. excitement   15. fear
+16. gratitude    17. grief        18. joy          19. love         20. nervousness
+21. optimism     22. pride        23. realization  24. relief       25. remorse
+26. sadness      27. surprise     28. neutral
+
+**ABSOLUTE RULE:**
+You will receive several numbered texts. Classify EACH text on its own and respond with valid JSON only.
+If unsure about an emotion, use "neutral".
+
+**CRITICAL:** Your response must be EXACTLY one JSON array with one object per input text, in input order:
+[
+    {"index": 0, "analysis": "brief reason here", "dim": "emotion_name", "score": 5.0},
+    {"index": 1, "analysis": "brief reason here", "dim": "emotion_name", "score": 5.0}
+]
+
+**EXAMPLE:**
+Input:
+0: I miss the old days
+1: This is amazing!
+Response: [{"index": 0, "analysis": "Nostalgic feeling not in list, using fallback", "dim": "neutral", "score": 5.0}, {"index": 1, "analysis": "Text expresses strong positive reaction", "dim": "joy", "score": 8.0}]
+
+**REQUIREMENTS:**
+- "index" must match the number in front of the input text
+- Use only emotions from the numbered list 1-28
+- Keep analysis brief (under 15 words)
+- Score must be between 0.0 and 10.0
+- No extra text before or after the JSON
+"""
+
+EMOTIONS = frozenset({
+    "admiration", "amusement", "anger", "annoyance", "approval",
+    "caring", "confusion", "curiosity", "desire", "disappointment",
+    "disapproval", "disgust", "embarrassment", "excitement", "fear",
+    "gratitude", "grief", "joy", "love", "nervousness",
+    "optimism", "pride", "realization", "relief", "remorse",
+    "sadness", "surprise", "neutral",
+})
+
 DEFAULT_MODEL = "gemma3:4b"
 
+# Part of every cache key, so editing either prompt invalidates cached results
+PROMPT_VERSION = hashlib.sha256((SYSTEM_PROMPT + BATCH_SYSTEM_PROMPT).encode("utf-8")).hexdigest()[:12]
+
+# Parallel in-flight requests to the Ollama host, and retries per message
+ANALYSIS_CONCURRENCY = int(os.getenv("ANALYSIS_CONCURRENCY", 4))
+ANALYSIS_RETRIES = int(os.getenv("ANALYSIS_RETRIES", 2))
+# Messages classified per LLM call; 1 falls back to the single-text prompt
+ANALYSIS_BATCH_SIZE = int(os.getenv("ANALYSIS_BATCH_SIZE", 8))
+RETRY_BACKOFF = 0.5
+# Local predictions at or above this confidence skip the LLM
+PRECLASSIFY_THRESHOLD = float(os.getenv("PRECLASSIFY_THRESHOLD", 0.8))
+
+_client: "AsyncClient | None" = None
+
+def get_client() -> "AsyncClient":
+    """Shared AsyncClient so every call reuses the same connection pool, created on first use"""
+    global _client
+    if _client is None:
+        from ollama import AsyncClient
+        _client = AsyncClient()
+    return _client
+
 def extract_json_list(text: str) -> str | None:
     match = re.search(r'\[\s*{.*?}\s*\]', text, re.DOTALL)
     return match.group(0) if match else None
 
-async def analyze_emotion(text: str, model: str = DEFAULT_MODEL) -> dict | None:
-    """Analyze emotion of a single text"""
+def validate_emotion(item) -> dict | None:
+    """Normalize one emotion object, or None if it is not one of the 28 emotions"""
+    if not isinstance(item, dict):
+        return None
+
+    dim = str(item.get("dim", "")).strip().lower()
+    if dim not in EMOTIONS:
+        return None
+
+    try:
+        score = float(item.get("score", 0))
+    except (TypeError, ValueError):
+        return None
+
+    # Validate and fix score
+    item["dim"] = dim
+    item["score"] = max(0.0, min(10.0, score))
+    item["analysis"] = str(item.get("analysis", ""))
+    return item
+
+def parse_emotion(content: str) -> dict | None:
+    """Pull the single emotion object out of a model reply, or None if malformed"""
+    json_str = extract_json_list(content)
+    if not json_str:
+        return None
+
+    try:
+        emotion_data = json.loads(json_str)
+    except json.JSONDecodeError:
+        return None
+    if not emotion_data:
+        return None
+    return validate_emotion(emotion_data[0])
+
+def parse_emotion_batch(content: str, size: int) -> list[dict | None]:
+    """Map a batch reply back onto input positions; missing or invalid items stay None"""
+    emotions: list[dict | None] = [None] * size
+    json_str = extract_json_list(content)
+    if not json_str:
+        return emotions
+
+    try:
+        emotion_data = json.loads(json_str)
+    except json.JSONDecodeError:
+        return emotions
+
+    for position, item in enumerate(emotion_data):
+        if not isinstance(item, dict):
+            continue
+        index = item.get("index", position)
+        if isinstance(index, int) and 0 <= index < size and emotions[index] is None:
+            emotions[index] = validate_emotion(item)
+    return emotions
+
+def record_usage(response, kind: str):
+    """Token counts Ollama reports with each reply, for tokens/sec per prompt kind"""
+    if response.eval_count:
+        inc("llm_tokens_total", response.eval_count, kind=kind)
+    if response.eval_duration:
+        inc("llm_eval_seconds_total", response.eval_duration / 1e9, kind=kind)
+
+async def analyze_emotion(text: str, model: str = DEFAULT_MODEL, retries: int = ANALYSIS_RETRIES) -> dict | None:
+    """Analyze emotion of a single text, retrying failed or malformed replies with backoff"""
     messages = [
         {'role': 'system', 'content': SYSTEM_PROMPT},
         {'role': 'user', 'content': text}
     ]
-    
-    try:
-        response = await AsyncClient().chat(model=model, messages=messages)
-        json_str = extract_json_list(response.message.content)
-        
-        if not json_str:
-            return None
-            
-        emotion_data = json.loads(json_str)
-        
-        # Validate and fix score
-        if emotion_data and len(emotion_data) > 0:
-            item = emotion_data[0]
-            score = float(item.get("score", 0))
-            item["score"] = max(0.0, min(10.0, score))
-            return item
-            
-    except Exception as e:
-        print(f"Error analyzing emotion: {e}")
-        
+
+    for attempt in range(retries + 1):
+        try:
+            with stage("llm_call", kind="single"):
+                response = await get_client().chat(model=model, messages=messages)
+            record_usage(response, "single")
+            item = parse_emotion(response.message.content)
+            if item:
+                return item
+            inc("llm_parse_failures_total", kind="single")
+        except Exception as e:
+            print(f"Error analyzing emotion: {e}")
+
+        if attempt < retries:
+            await asyncio.sleep(RETRY_BACKOFF * 2 ** attempt)
+
     return None
 
+async def analyze_batch(texts: list[str], model: str = DEFAULT_MODEL,
+                        retries: int = ANALYSIS_RETRIES) -> list[dict | None]:
+    """Classify several texts in one LLM call.
+
+    Items that come back missing or invalid are re-batched on their own, and
+    whatever is still unresolved after the retries goes through analyze_emotion.
+    """
+    emotions: list[dict | None] = [None] * len(texts)
+    pending = list(range(len(texts)))
+
+    for attempt in range(retries + 1):
+        if len(pending) <= 1:
+            break
+
+        prompt = "\n".join(f"{i}: {' '.join(texts[p].split())}" for i, p in enumerate(pending))
+        messages = [
+            {'role': 'system', 'content': BATCH_SYSTEM_PROMPT},
+            {'role': 'user', 'content': prompt}
+        ]
+        try:
+            with stage("llm_call", kind="batch"):
+                response = await get_client().chat(model=model, messages=messages)
+            record_usage(response, "batch")
+            batch = parse_emotion_batch(response.message.content, len(pending))
+            invalid = sum(emotion is None for emotion in batch)
+            if invalid == len(batch):
+                inc("llm_parse_failures_total", kind="batch")
+            elif invalid:
+                inc("llm_invalid_items_total", invalid, kind="batch")
+        except Exception as e:
+            print(f"Error analyzing emotion batch: {e}")
+            batch = [None] * len(pending)
+
+        for p, emotion in zip(pending, batch):
+            emotions[p] = emotion
+        pending = [p for p in pending if emotions[p] is None]
+
+        if pending and attempt < retries:
+            await asyncio.sleep(RETRY_BACKOFF * 2 ** attempt)
+
+    for p in pending:
+        emotions[p] = await analyze_emotion(texts[p], model)
+    return emotions
+
+def extract_messages(data) -> list[dict]:
+    """Normalize a conversation (dict with "messages", or a list) into text/timestamp entries"""
+    if isinstance(data, dict) and "messages" in data:
+        messages = data["messages"]
+    elif isinstance(data, list):
+        messages = data
+    else:
+        return []
+
+    entries = []
+    for msg in messages:
+        # Extract text from message
+        if isinstance(msg, dict) and msg.get("text"):
+            entries.append({"id": msg.get("id"), "text": msg["text"], "timestamp": msg.get("date")})
+        elif isinstance(msg, str) and msg:
+            entries.append({"id": None, "text": msg, "timestamp": None})
+    return entries
+
+def emotion_result(entry: dict, emotion: dict) -> dict:
+    result = {
+        "id": entry["id"],
+        "text": entry["text"],
+        "timestamp": entry["timestamp"],
+        "emotion": emotion["dim"],
+        "score": emotion["score"],
+        "analysis": emotion["analysis"],
+        "source": emotion.get("source", "llm")
+    }
+    if "confidence" in emotion:
+        result["confidence"] = emotion["confidence"]
+    return result
+
+# Short messages made up only of these tokens/emojis are classified without the LLM
+LEXICON = {
+    "ok": "neutral", "okay": "neutral", "k": "neutral", "kk": "neutral", "okie": "neutral",
+    "ya": "neutral", "yea": "neutral", "yeah": "neutral", "yes": "approval", "yep": "approval",
+    "sure": "approval", "bet": "approval", "alright": "approval", "no": "disapproval", "nope": "disapproval",
+    "ty": "gratitude", "tysm": "gratitude", "thx": "gratitude", "thanks": "gratitude", "thank": "gratitude",
+    "lol": "amusement", "lmao": "amusement", "lmfao": "amusement", "haha": "amusement", "hahaha": "amusement",
+    "hehe": "amusement", "rofl": "amusement", "ily": "love", "ilyt": "love", "love": "love",
+    "sorry": "remorse", "sry": "remorse", "omg": "surprise", "wow": "surprise", "whoa": "surprise",
+    "congrats": "admiration", "nice": "admiration", "cool": "approval", "ugh": "annoyance", "wtf": "anger",
+    "idk": "confusion", "huh": "confusion", "hmm": "curiosity", "yay": "joy", "miss": "sadness",
+    "😂": "amusement", "🤣": "amusement", "💀": "amusement", "😆": "amusement", "😭": "sadness",
+    "😢": "sadness", "😞": "disappointment", "😩": "annoyance", "😤": "annoyance", "😡": "anger",
+    "😠": "anger", "❤": "love", "❤️": "love", "😍": "love", "🥰": "love", "😘": "love", "💕": "love",
+    "🙏": "gratitude", "👍": "approval", "👌": "approval", "😮": "surprise", "😱": "fear",
+    "😳": "embarrassment", "🤔": "curiosity", "👀": "curiosity", "🎉": "excitement", "🥳": "excitement",
+    "😊": "joy", "😁": "joy", "😄": "joy", "🙂": "neutral", "😐": "neutral", "🤢": "disgust",
+}
+
+LEXICON_TOKEN = re.compile(r"[a-z']+|[\U0001F300-\U0001FAFF\u2600-\u27BF]\ufe0f?")
+
+def lexicon_emotion(text: str, max_tokens: int = 3) -> dict | None:
+    """Classify messages like "ok", "ty", "lol 😂" when every token agrees on one emotion"""
+    lowered = text.lower()
+    tokens = LEXICON_TOKEN.findall(lowered)
+    if not tokens or len(tokens) > max_tokens:
+        return None
+    # Anything other than lexicon tokens, spaces and light punctuation needs a real model
+    if LEXICON_TOKEN.sub("", lowered).strip(" .!?~,"):
+        return None
+
+    dims = {LEXICON.get(token.rstrip("\ufe0f"), LEXICON.get(token)) for token in tokens}
+    if len(dims) != 1 or None in dims:
+        return None
+
+    dim = dims.pop()
+    return {"dim": dim, "score": 5.0, "analysis": f"Lexicon match: {' '.join(tokens)}", "source": "lexicon"}
+
+class PreClassifier:
+    """Cheap local stage in front of the LLM: the lexicon first, then a TF-IDF +
+    logistic regression model trained on cached LLM labels.
+
+    Only predictions at or above `threshold` are kept; everything else is left
+    for the LLM. Kept predictions carry a fixed score and analysis text, like
+    lexicon matches, so retraining only changes them if the label changes;
+    the probability goes in a separate `confidence` field.
+
+    `report` tracks routing counts and, from a held-out split of the training
+    labels, how often confident local predictions agree with the LLM.
+    """
+
+    def __init__(self, threshold: float = PRECLASSIFY_THRESHOLD):
+        self.threshold = threshold
+        self.pipeline = None
+        self.routed = {"lexicon": 0, "model": 0, "llm": 0}
+        self.evaluation: dict = {}
+
+    def fit(self, labels: list[tuple[str, str, float]], min_samples: int = 200) -> dict:
+        """Train on (text, emotion, score) LLM labels; returns held-out agreement figures"""
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.linear_model import LogisticRegression
+        from sklearn.model_selection import train_test_split
+        from sklearn.pipeline import make_pipeline
+
+        labels = [(text, dim, score) for text, dim, score in labels if dim in EMOTIONS]
+        if len(labels) < min_samples or len({dim for _, dim, _ in labels}) < 2:
+            self.evaluation = {"trained": False, "samples": len(labels)}
+            return self.evaluation
+
+        texts = [text for text, _, _ in labels]
+        dims = [dim for _, dim, _ in labels]
+        train_x, test_x, train_y, test_y = train_test_split(texts, dims, test_size=0.2, random_state=0)
+
+        def build():
+            return make_pipeline(
+                TfidfVectorizer(analyzer="char_wb", ngram_range=(2, 4), min_df=2, sublinear_tf=True),
+                LogisticRegression(max_iter=1000, class_weight="balanced"),
+            )
+
+        held_out = build().fit(train_x, train_y)
+        proba = held_out.predict_proba(test_x)
+        confident = proba.max(axis=1) >= self.threshold
+        predicted = held_out.classes_[proba.argmax(axis=1)]
+        agree = predicted[confident] == [y for y, keep in zip(test_y, confident) if keep]
+
+        lexicon_hits = [(lexicon_emotion(text), dim) for text, dim in zip(test_x, test_y)]
+        lexicon_hits = [(hit["dim"], dim) for hit, dim in lexicon_hits if hit]
+
+        self.pipeline = build().fit(texts, dims)
+
+        self.evaluation = {
+            "trained": True,
+            "samples": len(labels),
+            "held_out": len(test_x),
+            "model_coverage": round(float(confident.mean()), 4),
+            "model_agreement": round(float(agree.mean()), 4) if agree.size else None,
+            "lexicon_coverage": round(len(lexicon_hits) / len(test_x), 4),
+            "lexicon_agreement": round(sum(a == b for a, b in lexicon_hits) / len(lexicon_hits), 4)
+            if lexicon_hits else None,
+        }
+        return self.evaluation
+
+    def classify(self, texts: list[str]) -> list[dict | None]:
+        """Confident local emotions, None where the LLM is still needed"""
+        emotions = [lexicon_emotion(text) for text in texts]
+
+        rest = [i for i, emotion in enumerate(emotions) if emotion is None]
+        if self.pipeline is not None and rest:
+            proba = self.pipeline.predict_proba([texts[i] for i in rest])
+            classes = self.pipeline.classes_
+            for i, row in zip(rest, proba):
+                best = int(row.argmax())
+                if row[best] >= self.threshold:
+                    emotions[i] = {
+                        "dim": str(classes[best]),
+                        "score": 5.0,
+                        "analysis": "Local classifier",
+                        "confidence": round(float(row[best]), 2),
+                        "source": "model",
+                    }
+
+        for emotion in emotions:
+            self.routed[emotion["source"] if emotion else "llm"] += 1
+        return emotions
+
+    def report(self) -> dict:
+        total = sum(self.routed.values())
+        return {
+            "threshold": self.threshold,
+            "routed": dict(self.routed),
+            "llm_rate": round(self.routed["llm"] / total, 4) if total else None,
+            **self.evaluation,
+        }
+
+async def stream_analysis(messages, model: str = DEFAULT_MODEL, concurrency: int = ANALYSIS_CONCURRENCY,
+                          batch_size: int = ANALYSIS_BATCH_SIZE, cache=None, stats: dict | None = None,
+                          preclassifier: PreClassifier | None = None):
+    """Yield (position, result) pairs as soon as each message is classified.
+
+    Messages already in `cache` (an EmotionCache), then those `preclassifier`
+    is confident about, are yielded first; a bounded pool of workers sends the
+    rest to the LLM, `batch_size` messages per call.
+    Messages that could not be classified are skipped. When given, `stats` is
+    filled in with throughput figures once the stream is exhausted.
+    """
+    entries = extract_messages(messages)
+    texts = [entry["text"] for entry in entries]
+    started = time.perf_counter()
+
+    if cache is not None:
+        emotions = await cache.get_many(texts, model, PROMPT_VERSION)
+    else:
+        emotions = [None] * len(entries)
+    cached = sum(emotion is not None for emotion in emotions)
+
+    if preclassifier is not None:
+        misses = [i for i, emotion in enumerate(emotions) if emotion is None]
+        for i, emotion in zip(misses, preclassifier.classify([texts[i] for i in misses])):
+            emotions[i] = emotion
+    todo = [i for i, emotion in enumerate(emotions) if emotion is None]
+
+    for i, emotion in enumerate(emotions):
+        if emotion:
+            yield i, emotion_result(entries[i], emotion)
+
+    batch_size = max(1, batch_size)
+    pending = iter(range(0, len(todo), batch_size))
+    done: asyncio.Queue = asyncio.Queue()
+
+    async def worker():
+        for start in pending:
+            positions = todo[start:start + batch_size]
+            try:
+                if len(positions) == 1:
+                    found = [await analyze_emotion(texts[positions[0]], model)]
+                else:
+                    found = await analyze_batch([texts[p] for p in positions], model)
+            except Exception as e:
+                print(f"Error analyzing emotion batch: {e}")
+                found = [None] * len(positions)
+            for p, emotion in zip(positions, found):
+                done.put_nowait((p, emotion))
+
+    workers = [asyncio.create_task(worker()) for _ in range(min(concurrency, -(-len(todo) // batch_size)))]
+    fresh = []
+    analyzed = len(entries) - len(todo)
+    try:
+        for _ in range(len(todo)):
+            p, emotion = await done.get()
+            if not emotion:
+                continue
+            analyzed += 1
+            fresh.append((texts[p], emotion))
+            yield p, emotion_result(entries[p], emotion)
+
+            if cache is not None and len(fresh) >= 100:
+                await cache.put_many(fresh, model, PROMPT_VERSION)
+                fresh = []
+    finally:
+        for task in workers:
+            task.cancel()
+        # Runs on a consumer that stopped early too: keep every label the LLM already paid for
+        while not done.empty():
+            p, emotion = done.get_nowait()
+            if emotion:
+                fresh.append((texts[p], emotion))
+        if cache is not None:
+            await cache.put_many(fresh, model, PROMPT_VERSION)
+
+    local = len(entries) - len(todo) - cached
+    for source, count in (("cache", cached), ("local", local), ("llm", analyzed - cached - local),
+                          ("failed", len(entries) - analyzed)):
+        if count:
+            inc("analysis_messages_total", count, source=source)
+
+    elapsed = time.perf_counter() - started
+    if stats is not None:
+        stats.update({
+            "messages": len(entries),
+            "cached": cached,
+            "local": local,
+            "analyzed": analyzed,
+            "failed": len(entries) - analyzed,
+            "concurrency": concurrency,
+            "batch_size": batch_size,
+            "seconds": round(elapsed, 3),
+            "messages_per_second": round(len(entries) / elapsed, 2) if elapsed else 0.0,
+        })
+
+async def analyze_messages(messages, model: str = DEFAULT_MODEL, concurrency: int = ANALYSIS_CONCURRENCY,
+                           batch_size: int = ANALYSIS_BATCH_SIZE, cache=None,
+                           preclassifier: PreClassifier | None = None) -> tuple[list[dict], dict]:
+    """Analyze a whole conversation; results keep the original message order.
+
+    The stats report throughput so the concurrency can be sized against the
+    Ollama host.
+    """
+    stats: dict = {}
+    found = {}
+    async for position, result in stream_analysis(messages, model, concurrency, batch_size, cache, stats,
+                                                  preclassifier):
+        found[position] = result
+
+    results = [found[position] for position in sorted(found)]
+    return results, stats
+
 async def analyze_file(file_path: str) -> list[dict]:
     """Analyze emotions in a JSON file containing messages"""
     try:
@@ -90,38 +541,13 @@ async def analyze_file(file_path: str) -> list[dict]:
         print(f"Error reading file: {e}")
         return []
 
-    # Extract messages
-    if isinstance(data, dict) and "messages" in data:
-        messages = data["messages"]
-    elif isinstance(data, list):
-        messages = data
-    else:
+    if not extract_messages(data):
         print("Invalid file format")
         return []
-    
-    results = []
-    for msg in messages:
-        # Extract text from message
-        if isinstance(msg, dict) and "text" in msg:
-            text = msg["text"]
-            timestamp = msg.get("date")
-        elif isinstance(msg, str):
-            text = msg
-            timestamp = None
-        else:
-            continue
-            
-        # Analyze emotion
-        emotion = await analyze_emotion(text)
-        if emotion:
-            results.append({
-                "text": text,
-                "timestamp": timestamp,
-                "emotion": emotion["dim"],
-                "score": emotion["score"],
-                "analysis": emotion["analysis"]
-            })
-    
+
+    results, stats = await analyze_messages(data)
+    print(f"Analyzed {stats['analyzed']}/{stats['messages']} messages "
+          f"in {stats['seconds']}s ({stats['messages_per_second']} msg/s)")
     return results
 
 async def main():
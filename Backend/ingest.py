@@ -0,0 +1,116 @@
+import asyncio
+import os
+
+from telethon import events
+from telethon.tl.types import InputPeerUser
+
+from store import MessageStore, sync_contact
+from telegram import ClientPool
+
+# Seconds to wait after the first update in a chat before flushing its burst
+INGEST_DEBOUNCE = float(os.getenv('INGEST_DEBOUNCE', 2.0))
+
+
+class IngestionService:
+    """Pushes new and edited private messages from Telegram into the message store.
+
+    Only contacts that are already in the store are followed. Updates are
+    buffered per chat and flushed together `delay` seconds after the first one,
+    then `on_update(contact_id, message_ids)` is awaited once per burst.
+    """
+
+    def __init__(self, pool: ClientPool, store: MessageStore, on_update, delay: float = INGEST_DEBOUNCE):
+        self.pool = pool
+        self.store = store
+        self.on_update = on_update
+        self.delay = delay
+        self.client = None
+        self._pending: dict[int, dict[int, object]] = {}
+        self._timers: dict[int, asyncio.Task] = {}
+        self._contacts: set[int] = set()
+
+    async def start(self):
+        # A retried start must not leave handlers on the client of an earlier attempt
+        if self.client is not None:
+            self.client.remove_event_handler(self._on_message)
+        self.client = self.pool.primary
+        self.client.add_event_handler(self._on_message, events.NewMessage(func=lambda e: e.is_private))
+        self.client.add_event_handler(self._on_message, events.MessageEdited(func=lambda e: e.is_private))
+        await self.catch_up()
+
+    async def stop(self):
+        if self.client is not None:
+            self.client.remove_event_handler(self._on_message)
+        timers = list(self._timers.values())
+        for task in timers:
+            task.cancel()
+        await asyncio.gather(*timers, return_exceptions=True)
+        self._timers.clear()
+        # Keep whatever is buffered, but leave the analysis to the next refresh
+        for contact_id in list(self._pending):
+            await self._flush(contact_id, notify=False)
+
+    async def catch_up(self):
+        """Fetch whatever arrived while the service was down, so pushed ids never leave a gap."""
+        # Peers come from the resolver's stored access hashes; a pooled session's entity cache
+        # may never have seen the user, and a bare user id can't be looked up from a user account
+        async with self.store.db.execute(
+            "SELECT c.contact_id, c.name, max(r.access_hash) AS access_hash FROM contacts c "
+            "LEFT JOIN resolved_contacts r ON r.user_id = c.contact_id GROUP BY c.contact_id"
+        ) as cur:
+            contacts = [tuple(row) for row in await cur.fetchall()]
+
+        for contact_id, name, access_hash in contacts:
+            # Through the pool, so a FloodWait moves the sync to another session instead of failing it
+            async def fetch(client, contact_id=contact_id, name=name, access_hash=access_hash):
+                if access_hash is None:
+                    peer = await client.get_input_entity(contact_id)
+                else:
+                    peer = InputPeerUser(contact_id, access_hash)
+                return await sync_contact(client, self.store, contact_id, name, peer)
+
+            try:
+                synced = await self.pool.run(fetch)
+            except Exception as e:
+                print(f"Catch-up for contact {contact_id} failed: {e}")
+                continue
+            self._contacts.add(contact_id)
+            if synced["new"]:
+                await self._notify(contact_id, [m["id"] for m in await self.store.messages(contact_id, synced["new"])])
+
+    async def _followed(self, contact_id: int) -> bool:
+        # Only positives are remembered, so contacts synced later get picked up
+        if contact_id not in self._contacts:
+            if await self.store.contact(contact_id) is None:
+                return False
+            self._contacts.add(contact_id)
+        return True
+
+    async def _on_message(self, event):
+        contact_id = event.chat_id
+        if not await self._followed(contact_id):
+            return
+
+        # Later edits of the same message replace the buffered version
+        self._pending.setdefault(contact_id, {})[event.message.id] = event.message
+        if contact_id not in self._timers:
+            self._timers[contact_id] = asyncio.create_task(self._flush_later(contact_id))
+
+    async def _flush_later(self, contact_id: int):
+        await asyncio.sleep(self.delay)
+        self._timers.pop(contact_id, None)
+        await self._flush(contact_id)
+
+    async def _flush(self, contact_id: int, notify: bool = True):
+        messages = self._pending.pop(contact_id, {})
+        if not messages:
+            return
+        await self.store.add_messages(contact_id, messages.values())
+        if notify:
+            await self._notify(contact_id, sorted(messages))
+
+    async def _notify(self, contact_id: int, message_ids: list[int]):
+        try:
+            await self.on_update(contact_id, message_ids)
+        except Exception as e:
+            print(f"Refresh after ingest for contact {contact_id} failed: {e}")
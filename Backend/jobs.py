@@ -0,0 +1,171 @@
+import asyncio
+import itertools
+import json
+import os
+import time
+import uuid
+
+from store import MessageStore
+
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))
+
+# Lower runs first: interactive suggestions jump ahead of bulk analysis
+PRIORITIES = {"suggestion": 0, "generate": 10}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    contact_id INTEGER,
+    priority INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status);
+"""
+
+ACTIVE = ("queued", "running")
+
+
+class JobQueue:
+    """Background jobs run by a bounded pool of workers, persisted in the message store.
+
+    Submitting a job whose (kind, contact_id) is already queued or running
+    returns the existing job instead of starting a duplicate; active jobs are
+    tracked in memory so concurrent submits can't both insert. Jobs that were
+    still queued or running when the process stopped are re-queued on open.
+    """
+
+    def __init__(self, store: MessageStore, handlers: dict, workers: int = JOB_WORKERS):
+        self.store = store
+        self.handlers = handlers
+        self.workers = workers
+        self._queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self._order = itertools.count()
+        self._running: dict[str, asyncio.Task] = {}
+        self._cancelled: set[str] = set()
+        # (kind, contact_id) of every queued or running job, and the reverse
+        self._active: dict[tuple, str] = {}
+        self._keys: dict[str, tuple] = {}
+        self._workers: list[asyncio.Task] = []
+
+    async def open(self):
+        await self.store.db.executescript(SCHEMA)
+        await self.store.db.execute("UPDATE jobs SET status = 'queued', started_at = NULL WHERE status = 'running'")
+        await self.store.db.commit()
+
+        async with self.store.db.execute(
+            "SELECT id, kind, contact_id, priority FROM jobs WHERE status = 'queued' ORDER BY created_at"
+        ) as cur:
+            for row in await cur.fetchall():
+                self._track(row["id"], (row["kind"], row["contact_id"]))
+                self._queue.put_nowait((row["priority"], next(self._order), row["id"]))
+
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def close(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def get(self, job_id: str) -> dict | None:
+        async with self.store.db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)) as cur:
+            row = await cur.fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        return job
+
+    async def submit(self, kind: str, contact_id: int | None = None) -> tuple[dict, bool]:
+        """Queue a job; returns (job, deduplicated)."""
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+
+        # Check and reserve before the first await, so a concurrent submit sees the reservation
+        existing = self._active.get((kind, contact_id))
+        if existing is not None:
+            return await self.get(existing), True
+
+        job_id = uuid.uuid4().hex
+        self._track(job_id, (kind, contact_id))
+        priority = PRIORITIES.get(kind, max(PRIORITIES.values()))
+        try:
+            await self.store.db.execute(
+                "INSERT INTO jobs (id, kind, contact_id, priority, status, created_at) VALUES (?, ?, ?, ?, 'queued', ?)",
+                (job_id, kind, contact_id, priority, time.time()),
+            )
+            await self.store.db.commit()
+        except BaseException:
+            self._untrack(job_id)
+            raise
+        self._queue.put_nowait((priority, next(self._order), job_id))
+        return await self.get(job_id), False
+
+    async def cancel(self, job_id: str) -> dict | None:
+        job = await self.get(job_id)
+        if job is None or job["status"] not in ACTIVE:
+            return job
+
+        task = self._running.get(job_id)
+        if task is not None:
+            self._cancelled.add(job_id)
+            task.cancel()
+        await self._finish(job_id, "cancelled")
+        return await self.get(job_id)
+
+    def _track(self, job_id: str, key: tuple):
+        self._active[key] = job_id
+        self._keys[job_id] = key
+
+    def _untrack(self, job_id: str):
+        key = self._keys.pop(job_id, None)
+        if key is not None and self._active.get(key) == job_id:
+            del self._active[key]
+
+    async def _finish(self, job_id: str, status: str, result=None, error: str | None = None):
+        self._untrack(job_id)
+        await self.store.db.execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ? AND status IN (?, ?)",
+            (status, json.dumps(result, ensure_ascii=False) if result is not None else None,
+             error, time.time(), job_id, *ACTIVE),
+        )
+        await self.store.db.commit()
+
+    async def _worker(self):
+        while True:
+            _, _, job_id = await self._queue.get()
+            job = await self.get(job_id)
+            if job is None or job["status"] != "queued":
+                continue
+
+            # A cancel may land between the read above and this claim; only a queued job is started
+            claimed = await self.store.db.execute(
+                "UPDATE jobs SET status = 'running', started_at = ? WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id),
+            )
+            await self.store.db.commit()
+            if claimed.rowcount == 0 or job_id not in self._keys:
+                continue
+
+            task = asyncio.create_task(self.handlers[job["kind"]](job["contact_id"]))
+            self._running[job_id] = task
+            try:
+                result = await task
+                await self._finish(job_id, "done", result=result)
+            except asyncio.CancelledError:
+                if job_id not in self._cancelled:
+                    # The worker itself is shutting down; leave the job to be re-queued
+                    task.cancel()
+                    raise
+            except Exception as e:
+                print(f"Job {job_id} ({job['kind']}) failed: {e}")
+                await self._finish(job_id, "failed", error=str(e))
+            finally:
+                self._running.pop(job_id, None)
+                self._cancelled.discard(job_id)
@@ -1,86 +1,409 @@
 
+import time
+IMPORT_STARTED = time.perf_counter()
+
 import os
+import asyncio
+import itertools
 import json
 import re
-from chatInference import textExtraction
-from RAGPipeline import suggesitonGeneration
-from fastapi.responses import JSONResponse
-from fastapi import FastAPI,Query
+import tempfile
+from contextlib import asynccontextmanager
+from chatInference import analyze_messages, stream_analysis, get_client, PreClassifier, DEFAULT_MODEL
+from RAGPipeline import suggesitonGeneration, suggestion_stream, index_analysis, get_index
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
+from fastapi import FastAPI,HTTPException,Query,Request
 from pydantic import BaseModel
-from telethon import TelegramClient
-from telethon.tl.functions.contacts import ImportContactsRequest
-from telethon.tl.types import InputPhoneContact
+from telegram import ClientPool
+from store import MessageStore, sync_contact
+from resolver import ContactResolver, RATE_LIMITED
+from cache import EmotionCache
+from jobs import JobQueue
+from stylometry import ProfileStore, render_profile
+from ingest import IngestionService
+from metrics import REGISTRY, collect_timings, observe, server_timing
+
+IMPORT_SECONDS = time.perf_counter() - IMPORT_STARTED
+# Imports plus lifespan setup should fit in this many seconds before serving
+STARTUP_BUDGET = float(os.getenv('STARTUP_BUDGET', 2.0))
+# Set to 0 to skip building the RAG index in the background and load it on first use
+WARMUP_RAG = os.getenv('WARMUP_RAG', '1') != '0'
+# Failed warm-ups are retried, backing off from 1s up to this many seconds between attempts
+WARMUP_RETRY_MAX = float(os.getenv('WARMUP_RETRY_MAX', 60.0))
+# Set to 1 to add a Server-Timing header with the stages each request went through
+TIMING_HEADERS = os.getenv('TIMING_HEADERS', '0') == '1'
+
+pool = ClientPool()
+store = MessageStore()
+resolver = ContactResolver(store)
+emotion_cache = EmotionCache()
+profiles = ProfileStore(store)
+preclassifier = PreClassifier()
+
+startup = {"import_seconds": round(IMPORT_SECONDS, 3), "serving_seconds": None, "subsystems": {}}
+# Retry loop of each subsystem, and its latest attempt at loading
+warmups: dict[str, asyncio.Task] = {}
+attempts: dict[str, asyncio.Future] = {}
+
+def start_warmup(name: str, load):
+    startup["subsystems"][name] = {"ready": False}
+    attempts[name] = asyncio.ensure_future(load())
+    warmups[name] = asyncio.create_task(warm(name, load))
+
+async def warm(name: str, load):
+    """Wait for a subsystem's load, retrying with backoff until it succeeds, and record how long it took"""
+    started = time.perf_counter()
+    delay = 1.0
+    for attempt in itertools.count(1):
+        try:
+            await attempts[name]
+        except Exception as e:
+            print(f"Warm-up of {name} failed (attempt {attempt}), retrying in {delay:.0f}s: {e}")
+            startup["subsystems"][name] = {"ready": False, "error": str(e), "attempts": attempt}
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, WARMUP_RETRY_MAX)
+            attempts[name] = asyncio.ensure_future(load())
+            continue
+        startup["subsystems"][name] = {"ready": True, "seconds": round(time.perf_counter() - started, 3),
+                                       "attempts": attempt}
+        return
+
+async def refresh_contact(contact_id: int, message_ids: list[int]):
+    """Analyze, index and profile just the messages a push update touched"""
+    messages = await store.by_ids(contact_id, message_ids)
+    results, _ = await analyze_messages(messages, cache=emotion_cache, preclassifier=preclassifier)
+    await asyncio.to_thread(index_analysis, results, contact_id)
+    await profiles.refresh(contact_id)
+
+ingestion = IngestionService(pool, store, refresh_contact)
+# Set to 0 to disable push ingestion and rely on POST /messages only
+INGEST = os.getenv('INGEST', '1') != '0'
+
+async def start_ingestion():
+    await require("telegram")
+    await ingestion.start()
+
+async def train_preclassifier() -> dict:
+    labels = await emotion_cache.labelled(DEFAULT_MODEL)
+    return await asyncio.to_thread(preclassifier.fit, labels)
+
+async def require(name: str):
+    """Wait for a subsystem's current warm-up attempt, or answer 503 if it failed.
+
+    A failed attempt is retried in the background, so a later call can succeed.
+    """
+    attempt = attempts[name]
+    await asyncio.wait([attempt])
+    if attempt.cancelled() or attempt.exception() is not None:
+        error = "cancelled" if attempt.cancelled() else attempt.exception()
+        raise HTTPException(status_code=503, detail=f"{name} unavailable: {error}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = time.perf_counter()
+    await store.open()
+    await resolver.open()
+    await emotion_cache.open()
+    await profiles.open()
+    await jobs.open()
+
+    start_warmup("telegram", pool.start)
+    # A real round trip, so /ready means Ollama answered and the pooled connection is open
+    start_warmup("ollama", lambda: get_client().list())
+    start_warmup("preclassifier", train_preclassifier)
+    if INGEST:
+        start_warmup("ingest", start_ingestion)
+    if WARMUP_RAG:
+        start_warmup("rag", lambda: asyncio.to_thread(get_index))
+
+    serving = IMPORT_SECONDS + time.perf_counter() - started
+    startup["serving_seconds"] = round(serving, 3)
+    if serving > STARTUP_BUDGET:
+        print(f"Startup took {serving:.2f}s, over the {STARTUP_BUDGET:.2f}s budget")
+    yield
 
-api_id = os.getenv('TELEGRAM_API_ID')
-api_hash = os.getenv('TELEGRAM_API_HASH')
+    pending = [*warmups.values(), *attempts.values()]
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    await ingestion.stop()
+    await jobs.close()
+    await pool.stop()
+    await emotion_cache.close()
+    await store.close()
 
-session = 'name'
-client = TelegramClient(session, api_id, api_hash)
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+@app.middleware("http")
+async def record_timings(request: Request, call_next):
+    # For streamed responses this is the time until streaming starts
+    started = time.perf_counter()
+    with collect_timings() as timings:
+        response = await call_next(request)
+    elapsed = time.perf_counter() - started
+
+    route = request.scope.get("route")
+    observe("http_request_seconds", elapsed, route=route.path if route else "unmatched",
+            method=request.method, status=str(response.status_code))
+    if TIMING_HEADERS:
+        response.headers["Server-Timing"] = server_timing(timings + [("total", elapsed)])
+    return response
 
 class ContactRequest(BaseModel):
     phone: str
     first_name: str = ""
     last_name: str = ""
+    limit: int = 10
+    before_id: int | None = None
+    backfill_pages: int = 0
     
 @app.get("/")
 async def get_messages():
     return {"message": "hello"}
+
+@app.get("/ready")
+async def ready():
+    required = ["telegram", "ollama"]
+    is_ready = all(startup["subsystems"].get(name, {}).get("ready") for name in required)
+    return JSONResponse({"ready": is_ready, **startup}, status_code=200 if is_ready else 503)
     
 @app.post("/messages")
 async def get_messages(data: ContactRequest):
-    async with client:
-        me = await client.get_me()
-        sender = f"{me.first_name} {me.last_name or ''}".strip()
-
-        contact = InputPhoneContact(0, f'+63{data.phone}', data.first_name, data.last_name)
-        res = await client(ImportContactsRequest([contact]))
-        if not res.users:
-            return {"error": "User not found."}
-
-        receiver = res.users[0]
-        rec_name = f"{receiver.first_name} {receiver.last_name or ''}".strip()
-
-        messages = []
-        async for msg in client.iter_messages(receiver.id, limit=10):
-            name = sender if msg.out else rec_name
-            messages.append({
-                "from": name,
-                "date": str(msg.date),
-                "text": msg.text
-            })
-
-        response_data = {
-            "sender": sender,
-            "receiver": rec_name,
-            "messages": messages
-        }
-
-        # Ensure the directory exists
-        save_dir = "saved_messages"
-        os.makedirs(save_dir, exist_ok=True)
-
-        # Sanitize receiver name for filename
-        safe_rec_name = re.sub(r'[^a-zA-Z0-9_-]', '_', rec_name)
-        filename = f"{safe_rec_name}.json"
-        file_path = os.path.join(save_dir, filename)
-        with open(file_path, "w", encoding="utf-8") as f:
-            json.dump(response_data, f, ensure_ascii=False, indent=2)
-
-        return {
-            "message": "Messages retrieved and saved as JSON.",
-            "file_path": file_path,
-            **response_data
-        }
+    await require("telegram")
+    sender = pool.sender_name()
+
+    async def fetch(client):
+        receiver = await resolver.resolve(client, f'+63{data.phone}', data.first_name, data.last_name)
+        if receiver is None or receiver is RATE_LIMITED:
+            return receiver, None
+
+        synced = await sync_contact(client, store, receiver.user_id, receiver.name, receiver.peer,
+                                    backfill_pages=data.backfill_pages)
+        return receiver, synced
+
+    receiver, synced = await pool.run(fetch)
+    if receiver is RATE_LIMITED:
+        raise HTTPException(status_code=429, detail="Telegram rate-limited this lookup; try again later.")
+    if receiver is None:
+        return {"error": "User not found."}
+
+    rec_name = receiver.name
+
+    messages = []
+    for msg in await store.messages(receiver.user_id, limit=data.limit, before_id=data.before_id):
+        name = sender if msg["out"] else rec_name
+        messages.append({
+            "id": msg["id"],
+            "from": name,
+            "date": msg["date"],
+            "text": msg["text"]
+        })
+
+    return {
+        "message": "Messages synced to the local store.",
+        "contact_id": receiver.user_id,
+        "synced": synced,
+        "total": await store.count(receiver.user_id),
+        "next_before_id": messages[-1]["id"] if len(messages) == data.limit else None,
+        "sender": sender,
+        "receiver": rec_name,
+        "messages": messages
+    }
+
+class ResolveRequest(BaseModel):
+    phones: list[str]
+
+@app.post("/contacts/resolve")
+async def resolve_contacts(data: ResolveRequest):
+    await require("telegram")
+    contacts = [(f'+63{phone}', "", "") for phone in data.phones]
+    resolved = await pool.run(lambda client: resolver.resolve_many(client, contacts))
+    results = {}
+    for phone in data.phones:
+        contact = resolved[f'+63{phone}']
+        if contact is RATE_LIMITED:
+            results[phone] = {"retry": True}
+        else:
+            results[phone] = {"user_id": contact.user_id, "name": contact.name} if contact else None
+    return results
+
+@app.delete("/contacts/{phone}")
+async def invalidate_contact(phone: str):
+    await resolver.invalidate(f'+63{phone}')
+    return {"message": "Contact cache entry removed."}
+
+async def analysis_events(contact_id: int, name: str):
+    """Analyze a contact's stored history page by page, yielding each result as it is classified.
+
+    Finishes with a stats event once the analysis file is written and indexed.
+    """
+    # Saved next to the conversation so the RAG pipeline can index it
+    safe_rec_name = re.sub(r'[^a-zA-Z0-9_-]', '_', name)
+    save_dir = "saved_messages"
+    os.makedirs(save_dir, exist_ok=True)
+    file_path = os.path.join(save_dir, f"{safe_rec_name}_analysis.json")
+
+    totals = {"messages": 0, "cached": 0, "local": 0, "analyzed": 0, "failed": 0, "indexed": 0}
+    started = time.perf_counter()
+    first_result = None
+
+    # Written under a name unique to this run and renamed into place once complete, so
+    # concurrent runs don't interleave and a dropped client leaves no half-written file
+    f = tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=os.path.dirname(file_path),
+                                    prefix=f"{safe_rec_name}_analysis.", suffix=".tmp", delete=False)
+    try:
+        with f:
+            f.write("[")
+            separator = "\n  "
+            async for page in store.iter_history(contact_id):
+                stats = {}
+                page_results = []
+                async for _, result in stream_analysis(page, cache=emotion_cache, stats=stats,
+                                                       preclassifier=preclassifier):
+                    if first_result is None:
+                        first_result = time.perf_counter() - started
+                    page_results.append(result)
+                    yield {"result": result}
+
+                page_results.sort(key=lambda result: result["id"])
+                for result in page_results:
+                    f.write(separator + json.dumps(result, ensure_ascii=False))
+                    separator = ",\n  "
+                totals["indexed"] += await asyncio.to_thread(index_analysis, page_results, contact_id)
+                for key in ("messages", "cached", "local", "analyzed", "failed"):
+                    totals[key] += stats[key]
+            f.write("\n]\n")
+    except BaseException:
+        os.remove(f.name)
+        raise
+    os.replace(f.name, file_path)
+
+    elapsed = time.perf_counter() - started
+    totals["seconds"] = round(elapsed, 3)
+    totals["first_result_seconds"] = round(first_result, 3) if first_result is not None else None
+    totals["messages_per_second"] = round(totals["messages"] / elapsed, 2) if elapsed else 0.0
+    yield {"file_path": file_path, "stats": totals}
+
+async def ndjson(events):
+    async for event in events:
+        yield json.dumps(event, ensure_ascii=False) + "\n"
+
 @app.get("/generate")
-async def generate():
-    result = await textExtraction()
-   
-    return JSONResponse(result)
+async def generate(contact_id: int, stream: bool = False):
+    contact = await store.contact(contact_id)
+    if contact is None:
+        return {"error": "Contact not synced."}
+
+    events = analysis_events(contact_id, contact["name"])
+    if stream:
+        return StreamingResponse(ndjson(events), media_type="application/x-ndjson")
+
+    results = []
+    async for event in events:
+        if "result" in event:
+            results.append(event["result"])
+        else:
+            summary = event
+    results.sort(key=lambda result: result["id"])
+
+    return JSONResponse({**summary, "results": results})
+
+
+async def generate_job(contact_id: int) -> dict:
+    contact = await store.contact(contact_id)
+    if contact is None:
+        raise ValueError("Contact not synced.")
+
+    # Results are in the analysis file; the job only keeps the summary
+    async for event in analysis_events(contact_id, contact["name"]):
+        summary = event
+    return summary
+
+async def typing_profile(contact_id: int | None) -> str | None:
+    """Prompt block describing how the user writes to this contact, brought up to date first"""
+    if contact_id is None:
+        return None
+    return render_profile(await profiles.refresh(contact_id), profile_name())
+
+def profile_name() -> str:
+    return pool.sender_name() if pool.me else "User"
+
+async def suggestion_job(contact_id: int | None) -> dict:
+    return {"suggestion": await suggesitonGeneration(contact_id, profile=await typing_profile(contact_id))}
+
+jobs = JobQueue(store, {"generate": generate_job, "suggestion": suggestion_job})
+
+class JobRequest(BaseModel):
+    kind: str
+    contact_id: int | None = None
+
+@app.post("/jobs")
+async def submit_job(data: JobRequest):
+    try:
+        job, deduplicated = await jobs.submit(data.kind, data.contact_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"deduplicated": deduplicated, **job}
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    job = await jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    job.pop("result")
+    return job
+
+@app.get("/jobs/{job_id}/result")
+async def job_result(job_id: str):
+    job = await jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    if job["status"] != "done":
+        return JSONResponse({"status": job["status"], "error": job["error"]}, status_code=409)
+    return job["result"]
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    job = await jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    job.pop("result")
+    return job
+
+@app.get("/profile/{contact_id}")
+async def get_profile(contact_id: int):
+    stats = await profiles.refresh(contact_id)
+    return {"profile": render_profile(stats, profile_name()), "stats": stats}
+
+@app.get("/preclassifier")
+async def preclassifier_report():
+    return preclassifier.report()
+
+@app.post("/preclassifier/train")
+async def retrain_preclassifier(threshold: float | None = None):
+    if threshold is not None:
+        preclassifier.threshold = threshold
+    await train_preclassifier()
+    return preclassifier.report()
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache")
+async def cache_stats():
+    return await emotion_cache.stats()
 
 
 @app.get("/suggestion")
-async def generate():
-    result = await suggesitonGeneration()
+async def generate(contact_id: int | None = None, stream: bool = False):
+    profile = await typing_profile(contact_id)
+    if stream:
+        tokens = await suggestion_stream(contact_id, profile=profile)
+        # Starlette drains the blocking token generator in its threadpool
+        lines = (json.dumps({"token": token}, ensure_ascii=False) + "\n" for token in tokens)
+        return StreamingResponse(lines, media_type="application/x-ndjson")
+
+    result = await suggesitonGeneration(contact_id, profile=profile)
    
     return JSONResponse(result)
@@ -0,0 +1,134 @@
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Upper bounds in seconds, from a cached lookup up to a full contact analysis
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+HELP = {
+    "stage_seconds": "Time spent in each pipeline stage.",
+    "stage_errors_total": "Pipeline stages that raised.",
+    "http_request_seconds": "Time to produce a response, per route.",
+    "llm_parse_failures_total": "Ollama replies without a single valid emotion.",
+    "llm_invalid_items_total": "Missing or invalid items in otherwise usable batch replies.",
+    "llm_tokens_total": "Tokens generated by Ollama.",
+    "llm_eval_seconds_total": "Time Ollama reported spending generating tokens.",
+    "analysis_messages_total": "Messages analyzed, by where the emotion came from.",
+    "embedded_nodes_total": "Analysis chunks embedded and written to the index.",
+}
+
+# Stage timings of the request being handled, for the Server-Timing header
+_request_timings: contextvars.ContextVar[list | None] = contextvars.ContextVar("request_timings", default=None)
+
+
+def _labels(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(labels: tuple, extra: tuple = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Registry:
+    """Counters and histograms kept in memory and rendered in the Prometheus text format.
+
+    Updates take a lock, since stages also run in worker threads (RAG calls go
+    through asyncio.to_thread).
+    """
+
+    def __init__(self, buckets: tuple = BUCKETS):
+        self.buckets = buckets
+        self._counters: dict[str, dict[tuple, float]] = {}
+        self._histograms: dict[str, dict[tuple, list]] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            key = _labels(labels)
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            # Per-bucket counts followed by the sum and the total count
+            state = series.setdefault(_labels(labels), [0] * len(self.buckets) + [0.0, 0])
+            slot = bisect_left(self.buckets, value)
+            if slot < len(self.buckets):
+                state[slot] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def stage(self, name: str, **labels):
+        """Time a block as `stage_seconds{stage=name}`; exceptions also bump `stage_errors_total`"""
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.inc("stage_errors_total", stage=name, **labels)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            self.observe("stage_seconds", elapsed, stage=name, **labels)
+            timings = _request_timings.get()
+            if timings is not None:
+                timings.append((name, elapsed))
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+                for labels, value in sorted(series.items()):
+                    lines.append(f"{name}{_format_labels(labels)} {value:g}")
+
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+                for labels, state in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(self.buckets, state):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(labels, (('le', f'{bound:g}'),))} {cumulative}")
+                    lines.append(f"{name}_bucket{_format_labels(labels, (('le', '+Inf'),))} {state[-1]}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {state[-2]:.6f}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {state[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+stage = REGISTRY.stage
+inc = REGISTRY.inc
+observe = REGISTRY.observe
+
+
+@contextmanager
+def collect_timings():
+    """Gather the stages run while handling one request; yields the (stage, seconds) list"""
+    timings = []
+    token = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
+
+
+def server_timing(timings: list[tuple[str, float]]) -> str:
+    """Server-Timing header value, summing repeated stages"""
+    totals: dict[str, list] = {}
+    for name, seconds in timings:
+        total = totals.setdefault(name, [0.0, 0])
+        total[0] += seconds
+        total[1] += 1
+    return ", ".join(
+        f'{name};dur={seconds * 1000:.1f}' + (f';desc="x{count}"' if count > 1 else "")
+        for name, (seconds, count) in totals.items()
+    )
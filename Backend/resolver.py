@@ -0,0 +1,213 @@
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from telethon.tl.functions.contacts import ImportContactsRequest
+from telethon.tl.types import InputPeerUser, InputPhoneContact
+
+from metrics import stage
+from store import MessageStore
+
+RESOLVER_TTL = float(os.getenv('RESOLVER_TTL', 7 * 24 * 3600))
+RESOLVER_CACHE_SIZE = int(os.getenv('RESOLVER_CACHE_SIZE', 1024))
+# Phones with no Telegram account are remembered for less time, in case they sign up
+RESOLVER_NEGATIVE_TTL = float(os.getenv('RESOLVER_NEGATIVE_TTL', 24 * 3600))
+
+# Reported for phones Telegram rate-limited (ImportContacts' retry_contacts); ask again later
+RATE_LIMITED = object()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS resolved_contacts (
+    phone TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    access_hash INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    resolved_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS unresolved_phones (
+    phone TEXT PRIMARY KEY,
+    checked_at REAL NOT NULL
+);
+"""
+
+
+@dataclass
+class ResolvedContact:
+    phone: str
+    user_id: int
+    access_hash: int
+    name: str
+    resolved_at: float
+
+    @property
+    def peer(self) -> InputPeerUser:
+        return InputPeerUser(self.user_id, self.access_hash)
+
+
+class ContactResolver:
+    """Phone -> Telegram user lookups, cached in memory (LRU) and in the message store.
+
+    Only phones missing from both caches, or older than the TTL, are sent to
+    ImportContactsRequest, and those go out together in a single import.
+    Phones that resolve to nobody are cached too, for `negative_ttl`; phones
+    Telegram rate-limited are not cached and come back as RATE_LIMITED.
+    """
+
+    def __init__(self, store: MessageStore, ttl: float = RESOLVER_TTL, maxsize: int = RESOLVER_CACHE_SIZE,
+                 negative_ttl: float = RESOLVER_NEGATIVE_TTL):
+        self.store = store
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.negative_ttl = negative_ttl
+        self._lru: OrderedDict[str, ResolvedContact] = OrderedDict()
+        self._misses: OrderedDict[str, float] = OrderedDict()
+
+    async def open(self):
+        await self.store.db.executescript(SCHEMA)
+        await self.store.db.commit()
+
+    def _fresh(self, contact: ResolvedContact) -> bool:
+        return time.time() - contact.resolved_at < self.ttl
+
+    def _known_missing(self, phone: str) -> bool:
+        checked_at = self._misses.get(phone)
+        return checked_at is not None and time.time() - checked_at < self.negative_ttl
+
+    def _remember_missing(self, phones: list[str], checked_at: float):
+        for phone in phones:
+            self._misses[phone] = checked_at
+            self._misses.move_to_end(phone)
+        while len(self._misses) > self.maxsize:
+            self._misses.popitem(last=False)
+
+    async def _load_missing(self, phones: list[str]) -> dict[str, float]:
+        placeholders = ",".join("?" * len(phones))
+        async with self.store.db.execute(
+            f"SELECT phone, checked_at FROM unresolved_phones WHERE phone IN ({placeholders})", phones
+        ) as cur:
+            return {row["phone"]: row["checked_at"] for row in await cur.fetchall()}
+
+    def _remember(self, contact: ResolvedContact):
+        self._lru[contact.phone] = contact
+        self._lru.move_to_end(contact.phone)
+        while len(self._lru) > self.maxsize:
+            self._lru.popitem(last=False)
+
+    async def _load(self, phones: list[str]) -> dict[str, ResolvedContact]:
+        placeholders = ",".join("?" * len(phones))
+        async with self.store.db.execute(
+            f"SELECT phone, user_id, access_hash, name, resolved_at FROM resolved_contacts WHERE phone IN ({placeholders})",
+            phones,
+        ) as cur:
+            rows = await cur.fetchall()
+        return {row["phone"]: ResolvedContact(**dict(row)) for row in rows}
+
+    async def _save(self, contacts: list[ResolvedContact]):
+        await self.store.db.executemany(
+            "INSERT OR REPLACE INTO resolved_contacts (phone, user_id, access_hash, name, resolved_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [(c.phone, c.user_id, c.access_hash, c.name, c.resolved_at) for c in contacts],
+        )
+        await self.store.db.commit()
+
+    async def resolve(self, client, phone: str, first_name: str = "", last_name: str = "") -> ResolvedContact | object | None:
+        return (await self.resolve_many(client, [(phone, first_name, last_name)]))[phone]
+
+    async def resolve_many(self, client, contacts: list[tuple[str, str, str]]) -> dict[str, ResolvedContact | object | None]:
+        """Resolve (phone, first_name, last_name) tuples; unknown numbers map to None, rate-limited ones to RATE_LIMITED."""
+        resolved: dict[str, ResolvedContact | object | None] = {}
+        pending = []
+        for phone, first_name, last_name in contacts:
+            cached = self._lru.get(phone)
+            if cached and self._fresh(cached):
+                self._lru.move_to_end(phone)
+                resolved[phone] = cached
+            elif self._known_missing(phone):
+                resolved[phone] = None
+            else:
+                pending.append((phone, first_name, last_name))
+
+        if pending:
+            phones = [phone for phone, _, _ in pending]
+            stored = await self._load(phones)
+            stored_missing = await self._load_missing(phones)
+            missing = []
+            for entry in pending:
+                contact = stored.get(entry[0])
+                checked_at = stored_missing.get(entry[0])
+                if contact and self._fresh(contact):
+                    self._remember(contact)
+                    resolved[entry[0]] = contact
+                elif checked_at is not None and time.time() - checked_at < self.negative_ttl:
+                    self._remember_missing([entry[0]], checked_at)
+                    resolved[entry[0]] = None
+                else:
+                    missing.append(entry)
+
+            if missing:
+                imported = await self._import(client, missing)
+                for phone, _, _ in missing:
+                    resolved[phone] = imported.get(phone)
+
+        return resolved
+
+    async def _import(self, client, contacts: list[tuple[str, str, str]]) -> dict[str, ResolvedContact | object]:
+        request = [
+            InputPhoneContact(i, phone, first_name, last_name or "")
+            for i, (phone, first_name, last_name) in enumerate(contacts)
+        ]
+        with stage("telegram_import_contacts"):
+            res = await client(ImportContactsRequest(request))
+
+        users = {user.id: user for user in res.users}
+        now = time.time()
+        found = []
+        for item in res.imported:
+            user = users.get(item.user_id)
+            if user is None:
+                continue
+            found.append(ResolvedContact(
+                phone=contacts[item.client_id][0],
+                user_id=user.id,
+                access_hash=user.access_hash,
+                name=f"{user.first_name} {user.last_name or ''}".strip(),
+                resolved_at=now,
+            ))
+
+        if found:
+            await self._save(found)
+            await self.store.db.executemany(
+                "DELETE FROM unresolved_phones WHERE phone = ?", [(contact.phone,) for contact in found]
+            )
+            await self.store.db.commit()
+        for contact in found:
+            self._remember(contact)
+            self._misses.pop(contact.phone, None)
+
+        matched = {contact.phone for contact in found}
+        # Not looked up at all, so not evidence that the phone has no account
+        retry = {contacts[i][0] for i in res.retry_contacts}
+        unknown = [phone for phone, _, _ in contacts if phone not in matched and phone not in retry]
+        if unknown:
+            await self.store.db.executemany(
+                "INSERT OR REPLACE INTO unresolved_phones (phone, checked_at) VALUES (?, ?)",
+                [(phone, now) for phone in unknown],
+            )
+            await self.store.db.commit()
+            self._remember_missing(unknown, now)
+        return {**{phone: RATE_LIMITED for phone in retry}, **{contact.phone: contact for contact in found}}
+
+    async def invalidate(self, phone: str | None = None):
+        """Forget one phone, or every cached phone when none is given."""
+        if phone is None:
+            self._lru.clear()
+            self._misses.clear()
+            await self.store.db.execute("DELETE FROM resolved_contacts")
+            await self.store.db.execute("DELETE FROM unresolved_phones")
+        else:
+            self._lru.pop(phone, None)
+            self._misses.pop(phone, None)
+            await self.store.db.execute("DELETE FROM resolved_contacts WHERE phone = ?", (phone,))
+            await self.store.db.execute("DELETE FROM unresolved_phones WHERE phone = ?", (phone,))
+        await self.store.db.commit()
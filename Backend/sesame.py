@@ -1,94 +1,434 @@
-from sesame_ai import SesameAI, SesameWebSocket, TokenManager
-import pyaudio
+import argparse
 import threading
 import time
+import wave
+
 import numpy as np
 
-# Get authentication token using TokenManager
-api_client = SesameAI()
-token_manager = TokenManager(api_client, token_file="token.json")
-id_token = token_manager.get_valid_token()
+# Audio settings
+CHUNK = 1024          # default frame size in samples
+CHANNELS = 1
+RATE = 16000          # rate the microphone audio is sent to the server at
+JITTER_MS = 120       # audio buffered before playback starts or resumes after an underrun
+BUFFER_SECONDS = 5    # capacity of the playback ring buffer
 
-# Connect to WebSocket (choose character: "Miles" or "Maya")
-ws = SesameWebSocket(id_token=id_token, character="Maya")
 
-# Set up connection callbacks
-def on_connect():
-    print("Connected to SesameAI!")
+class RingBuffer:
+    """Preallocated single-producer/single-consumer ring of int16 samples.
 
-def on_disconnect():
-    print("Disconnected from SesameAI")
+    Writes that do not fit overwrite the oldest audio (counted as overruns)
+    so a stalled consumer never makes latency grow without bound.
+    """
 
-ws.set_connect_callback(on_connect)
-ws.set_disconnect_callback(on_disconnect)
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._data = np.zeros(capacity, dtype=np.int16)
+        self._read = 0
+        self._size = 0
+        self._lock = threading.Lock()
+        self.overruns = 0
 
-# Connect to the server
-ws.connect()
+    def __len__(self):
+        return self._size
 
-# Audio settings
-CHUNK = 1024
-FORMAT = pyaudio.paInt16
-CHANNELS = 1
-RATE = 16000
-
-# Initialize PyAudio
-p = pyaudio.PyAudio()
-
-# Open microphone stream
-mic_stream = p.open(format=FORMAT,
-                    channels=CHANNELS,
-                    rate=RATE,
-                    input=True,
-                    frames_per_buffer=CHUNK)
-
-# Open speaker stream (using server's sample rate)
-speaker_stream = p.open(format=FORMAT,
-                        channels=CHANNELS,
-                        rate=ws.server_sample_rate,
-                        output=True)
-
-# Function to capture and send microphone audio
-def capture_microphone():
-    print("Microphone capture started...")
-    try:
-        while True:
-            if ws.is_connected():
-                data = mic_stream.read(CHUNK, exception_on_overflow=False)
-                ws.send_audio_data(data)
-            else:
-                time.sleep(0.1)
-    except KeyboardInterrupt:
-        print("Microphone capture stopped")
+    def write(self, samples: np.ndarray):
+        with self._lock:
+            n = len(samples)
+            if n > self.capacity:
+                samples = samples[-self.capacity:]
+                n = self.capacity
+            overflow = self._size + n - self.capacity
+            if overflow > 0:
+                self._read = (self._read + overflow) % self.capacity
+                self._size -= overflow
+                self.overruns += 1
+
+            start = (self._read + self._size) % self.capacity
+            first = min(n, self.capacity - start)
+            self._data[start:start + first] = samples[:first]
+            self._data[:n - first] = samples[first:]
+            self._size += n
+
+    def read_into(self, out: np.ndarray) -> int:
+        """Copy up to len(out) samples into `out`; returns how many were available."""
+        with self._lock:
+            n = min(len(out), self._size)
+            first = min(n, self.capacity - self._read)
+            out[:first] = self._data[self._read:self._read + first]
+            out[first:n] = self._data[:n - first]
+            self._read = (self._read + n) % self.capacity
+            self._size -= n
+            return n
+
+
+class JitterBuffer(RingBuffer):
+    """Ring buffer that holds playback until `target` samples are queued.
+
+    When it runs dry mid-stream the missing part of the frame is filled with
+    silence, the underrun is counted and buffering starts over.
+    """
+
+    def __init__(self, capacity: int, target: int):
+        super().__init__(capacity)
+        self.target = target
+        self.underruns = 0
+        self._buffering = True
+
+    def read_frame(self, out: np.ndarray) -> bool:
+        """Fill `out` with the next frame; returns False while (re)buffering."""
+        if self._buffering:
+            if len(self) < self.target:
+                out[:] = 0
+                return False
+            self._buffering = False
+
+        n = self.read_into(out)
+        if n < len(out):
+            out[n:] = 0
+            self.underruns += 1
+            self._buffering = True
+        return True
+
+
+class Resampler:
+    """Streaming linear-interpolation resampler for mono int16 audio.
+
+    All work arrays are allocated up front for `max_input` samples per call;
+    the returned array is a view into an internal buffer that is reused by the
+    next call, so it has to be consumed (written or sent) first.
+    """
+
+    def __init__(self, in_rate: int, out_rate: int, max_input: int):
+        self.in_rate = in_rate
+        self.out_rate = out_rate
+        self.passthrough = in_rate == out_rate
+        self.step = in_rate / out_rate
+        self._phase = 1.0  # position of the next output sample, in units of input samples
+        max_output = int(np.ceil((max_input + 1) / self.step)) + 1
+
+        self._src = np.zeros(max_input + 2, dtype=np.float32)
+        self._ramp = np.arange(max_output, dtype=np.float64) * self.step
+        self._pos = np.empty(max_output, dtype=np.float64)
+        self._floor = np.empty(max_output, dtype=np.float64)
+        self._idx = np.empty(max_output, dtype=np.intp)
+        self._idx_next = np.empty(max_output, dtype=np.intp)
+        self._frac = np.empty(max_output, dtype=np.float32)
+        self._a = np.empty(max_output, dtype=np.float32)
+        self._b = np.empty(max_output, dtype=np.float32)
+        self._out = np.empty(max_output, dtype=np.int16)
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        if self.passthrough:
+            return samples
+
+        n = len(samples)
+        # _src[0] holds the last sample of the previous chunk for continuity
+        self._src[1:n + 1] = samples
+        m = max(0, int(np.ceil((n - self._phase) / self.step)))
+        if m == 0:
+            self._phase -= n
+            self._src[0] = self._src[n]
+            return self._out[:0]
+
+        pos, floor, idx, idx_next = self._pos[:m], self._floor[:m], self._idx[:m], self._idx_next[:m]
+        frac, a, b, out = self._frac[:m], self._a[:m], self._b[:m], self._out[:m]
+
+        np.add(self._ramp[:m], self._phase, out=pos)
+        np.floor(pos, out=floor)
+        np.copyto(idx, floor, casting="unsafe")
+        np.add(idx, 1, out=idx_next)
+        np.subtract(pos, floor, out=frac, casting="unsafe")
+        np.take(self._src, idx, out=a)
+        np.take(self._src, idx_next, out=b)
+        np.subtract(b, a, out=b)
+        np.multiply(b, frac, out=b)
+        np.add(a, b, out=a)
+        np.rint(a, out=a)
+        np.clip(a, -32768, 32767, out=a)
+        np.copyto(out, a, casting="unsafe")
+
+        self._phase = self._phase + m * self.step - n
+        self._src[0] = self._src[n]
+        return out
+
+
+class LatencyStats:
+    """Running latency figures in milliseconds, with a fixed window for percentiles"""
+
+    def __init__(self, window: int = 2048):
+        self._window = np.zeros(window, dtype=np.float64)
+        self.count = 0
+        self.max = 0.0
+
+    def add(self, ms: float):
+        self._window[self.count % len(self._window)] = ms
+        self.count += 1
+        self.max = max(self.max, ms)
+
+    def summary(self) -> str:
+        if not self.count:
+            return "no samples"
+        window = self._window[:min(self.count, len(self._window))]
+        p50, p95 = np.percentile(window, [50, 95])
+        return f"p50 {p50:.1f} ms, p95 {p95:.1f} ms, max {self.max:.1f} ms ({self.count} frames)"
+
+
+# --- Audio devices -----------------------------------------------------------
+# A device reads microphone frames and writes playback frames as int16 arrays.
+
+class PyAudioDevice:
+    def __init__(self, in_rate: int, out_rate: int, frame: int):
+        import pyaudio
+
+        self._p = pyaudio.PyAudio()
+        self.in_rate = in_rate
+        self.out_rate = out_rate
+        self.mic_stream = self._p.open(format=pyaudio.paInt16, channels=CHANNELS, rate=in_rate,
+                                       input=True, frames_per_buffer=frame)
+        self.speaker_stream = self._p.open(format=pyaudio.paInt16, channels=CHANNELS, rate=out_rate,
+                                           output=True, frames_per_buffer=frame)
+
+    def read(self, frame: int) -> np.ndarray:
+        return np.frombuffer(self.mic_stream.read(frame, exception_on_overflow=False), dtype=np.int16)
+
+    def write(self, samples: np.ndarray):
+        self.speaker_stream.write(samples.tobytes())
+
+    def close(self):
+        for stream in (self.mic_stream, self.speaker_stream):
+            stream.stop_stream()
+            stream.close()
+        self._p.terminate()
+
+
+class PacedDevice:
+    """Base for headless devices: reads and writes block in real time like a sound card would"""
+
+    def __init__(self, in_rate: int, out_rate: int):
+        self.in_rate = in_rate
+        self.out_rate = out_rate
+        self._in_due = self._out_due = time.monotonic()
+
+    @staticmethod
+    def _pace(due: float, seconds: float) -> float:
+        due = max(due, time.monotonic() - 0.5) + seconds
+        delay = due - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        return due
 
-# Function to play received audio
-def play_audio():
-    print("Audio playback started...")
+    def read(self, frame: int) -> np.ndarray:
+        self._in_due = self._pace(self._in_due, frame / self.in_rate)
+        return self._capture(frame)
+
+    def write(self, samples: np.ndarray):
+        self._out_due = self._pace(self._out_due, len(samples) / self.out_rate)
+        self._play(samples)
+
+    def _capture(self, frame: int) -> np.ndarray:
+        raise NotImplementedError
+
+    def _play(self, samples: np.ndarray):
+        pass
+
+    def close(self):
+        pass
+
+
+class NullDevice(PacedDevice):
+    """Silent microphone and a speaker that discards everything"""
+
+    def __init__(self, in_rate: int, out_rate: int, frame: int):
+        super().__init__(in_rate, out_rate)
+        self._silence = np.zeros(frame, dtype=np.int16)
+
+    def _capture(self, frame: int) -> np.ndarray:
+        return self._silence[:frame]
+
+
+class WavDevice(PacedDevice):
+    """Plays a mono 16-bit WAV file as the microphone (then silence) and/or records playback to one"""
+
+    def __init__(self, in_rate: int, out_rate: int, frame: int, input_path: str | None, output_path: str | None):
+        super().__init__(in_rate, out_rate)
+        self._silence = np.zeros(frame, dtype=np.int16)
+        self._source = None
+        self._sink = None
+        if input_path:
+            self._source = wave.open(input_path, "rb")
+            if self._source.getnchannels() != 1 or self._source.getsampwidth() != 2:
+                raise ValueError("Input WAV must be mono 16-bit PCM")
+            self.in_rate = self._source.getframerate()
+        if output_path:
+            self._sink = wave.open(output_path, "wb")
+            self._sink.setnchannels(1)
+            self._sink.setsampwidth(2)
+            self._sink.setframerate(out_rate)
+
+    def _capture(self, frame: int) -> np.ndarray:
+        if self._source is None:
+            return self._silence[:frame]
+        data = np.frombuffer(self._source.readframes(frame), dtype=np.int16)
+        if len(data) < frame:
+            return self._silence[:frame]
+        return data
+
+    def _play(self, samples: np.ndarray):
+        if self._sink is not None:
+            self._sink.writeframes(samples.tobytes())
+
+    def close(self):
+        for f in (self._source, self._sink):
+            if f is not None:
+                f.close()
+
+
+def open_device(spec_in: str, spec_out: str, in_rate: int, out_rate: int, frame: int):
+    """Device from --input/--output specs: "mic"/"speaker", "null", or "wav:<path>" """
+    if spec_in == "mic" or spec_out == "speaker":
+        if (spec_in, spec_out) != ("mic", "speaker"):
+            raise ValueError("PyAudio is used for both directions or neither")
+        return PyAudioDevice(in_rate, out_rate, frame)
+    if spec_in.startswith("wav:") or spec_out.startswith("wav:"):
+        return WavDevice(in_rate, out_rate, frame,
+                         spec_in[4:] if spec_in.startswith("wav:") else None,
+                         spec_out[4:] if spec_out.startswith("wav:") else None)
+    return NullDevice(in_rate, out_rate, frame)
+
+
+class AudioPipeline:
+    """Moves audio between a device and the Sesame websocket on three threads.
+
+    capture: device -> resample to RATE -> websocket
+    receive: websocket -> resample to the device rate -> jitter buffer
+    playback: jitter buffer -> device, one fixed frame at a time
+    """
+
+    def __init__(self, ws, device, frame: int = CHUNK, jitter_ms: int = JITTER_MS, send_rate: int = RATE):
+        self.ws = ws
+        self.device = device
+        self.frame = frame
+        self.running = threading.Event()
+        self.connected = threading.Event()
+
+        server_rate = ws.server_sample_rate
+        self.max_chunk = server_rate // 10  # larger received chunks are resampled in slices
+        self.mic_resampler = Resampler(device.in_rate, send_rate, frame)
+        self.speaker_resampler = Resampler(server_rate, device.out_rate, self.max_chunk)
+        self.jitter = JitterBuffer(device.out_rate * BUFFER_SECONDS, device.out_rate * jitter_ms // 1000)
+        self._playback_frame = np.zeros(frame, dtype=np.int16)
+
+        self.capture_to_send = LatencyStats()
+        self.receive_to_playback = LatencyStats()
+        self.frames_sent = 0
+        self.frames_played = 0
+
+    def on_connect(self):
+        print("Connected to SesameAI!")
+        self.connected.set()
+
+    def on_disconnect(self):
+        print("Disconnected from SesameAI")
+        self.connected.clear()
+
+    def capture(self):
+        print("Microphone capture started...")
+        while self.running.is_set():
+            if not self.connected.wait(timeout=0.5):
+                continue
+            samples = self.device.read(self.frame)
+            captured = time.perf_counter()
+            out = self.mic_resampler.process(samples)
+            if len(out):
+                self.ws.send_audio_data(out.tobytes())
+                self.capture_to_send.add((time.perf_counter() - captured) * 1000)
+                self.frames_sent += 1
+
+    def receive(self):
+        while self.running.is_set():
+            chunk = self.ws.get_next_audio_chunk(timeout=0.2)
+            if not chunk:
+                continue
+            samples = np.frombuffer(chunk, dtype=np.int16)
+            for start in range(0, len(samples), self.max_chunk):
+                self.jitter.write(self.speaker_resampler.process(samples[start:start + self.max_chunk]))
+
+    def playback(self):
+        print("Audio playback started...")
+        out = self._playback_frame
+        while self.running.is_set():
+            # Audio queued ahead of this frame is how long it waited since arriving
+            queued_ms = len(self.jitter) * 1000 / self.device.out_rate
+            if self.jitter.read_frame(out):
+                self.receive_to_playback.add(queued_ms)
+                self.frames_played += 1
+            self.device.write(out)
+
+    def start(self):
+        self.running.set()
+        if self.ws.is_connected():
+            self.connected.set()
+        self.threads = [threading.Thread(target=target, daemon=True)
+                        for target in (self.capture, self.receive, self.playback)]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        self.running.clear()
+        for thread in self.threads:
+            thread.join(timeout=1)
+
+    def report(self) -> str:
+        return (f"capture->send: {self.capture_to_send.summary()}\n"
+                f"receive->playback: {self.receive_to_playback.summary()}\n"
+                f"sent {self.frames_sent} frames, played {self.frames_played} frames, "
+                f"{self.jitter.underruns} underruns, {self.jitter.overruns} overruns")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Talk to a Sesame character")
+    parser.add_argument("--character", default="Maya", choices=["Miles", "Maya"])
+    parser.add_argument("--input", default="mic", help='"mic", "null" or "wav:<path>"')
+    parser.add_argument("--output", default="speaker", help='"speaker", "null" or "wav:<path>"')
+    parser.add_argument("--frame", type=int, default=CHUNK, help="samples per captured/played frame")
+    parser.add_argument("--jitter-ms", type=int, default=JITTER_MS)
+    parser.add_argument("--output-rate", type=int, help="device playback rate (default: server rate)")
+    parser.add_argument("--duration", type=float, help="stop after this many seconds")
+    parser.add_argument("--report-every", type=float, default=10.0)
+    args = parser.parse_args()
+
+    from sesame_ai import SesameAI, SesameWebSocket, TokenManager
+
+    # Get authentication token using TokenManager
+    api_client = SesameAI()
+    token_manager = TokenManager(api_client, token_file="token.json")
+    id_token = token_manager.get_valid_token()
+
+    ws = SesameWebSocket(id_token=id_token, character=args.character)
+    ws.connect()
+
+    device = open_device(args.input, args.output, RATE, args.output_rate or ws.server_sample_rate, args.frame)
+    pipeline = AudioPipeline(ws, device, frame=args.frame, jitter_ms=args.jitter_ms)
+    ws.set_connect_callback(pipeline.on_connect)
+    ws.set_disconnect_callback(pipeline.on_disconnect)
+    pipeline.start()
+
+    started = last_report = time.monotonic()
     try:
-        while True:
-            audio_chunk = ws.get_next_audio_chunk(timeout=0.01)
-            if audio_chunk:
-                speaker_stream.write(audio_chunk)
+        while args.duration is None or time.monotonic() - started < args.duration:
+            time.sleep(0.5)
+            if time.monotonic() - last_report >= args.report_every:
+                print(pipeline.report())
+                last_report = time.monotonic()
     except KeyboardInterrupt:
-        print("Audio playback stopped")
-
-# Start audio threads
-mic_thread = threading.Thread(target=capture_microphone)
-mic_thread.daemon = True
-mic_thread.start()
-
-playback_thread = threading.Thread(target=play_audio)
-playback_thread.daemon = True
-playback_thread.start()
-
-# Keep the main thread alive
-try:
-    while True:
-        time.sleep(1)
-except KeyboardInterrupt:
+        pass
+
     print("Disconnecting...")
+    pipeline.stop()
     ws.disconnect()
-    mic_stream.stop_stream()
-    mic_stream.close()
-    speaker_stream.stop_stream()
-    speaker_stream.close()
-    p.terminate()
\ No newline at end of file
+    device.close()
+    print(pipeline.report())
+
+
+if __name__ == "__main__":
+    main()
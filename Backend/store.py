@@ -0,0 +1,191 @@
+import os
+
+import aiosqlite
+
+from metrics import stage
+
+DB_PATH = os.getenv('MESSAGE_DB', os.path.join('saved_messages', 'messages.db'))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS contacts (
+    contact_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    backfilled INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS messages (
+    contact_id INTEGER NOT NULL,
+    id INTEGER NOT NULL,
+    out INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    text TEXT,
+    PRIMARY KEY (contact_id, id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS history_revisions (
+    contact_id INTEGER PRIMARY KEY,
+    revision INTEGER NOT NULL
+);
+"""
+
+
+class MessageStore:
+    """SQLite-backed history of every contact's messages, keyed by Telegram message id."""
+
+    def __init__(self, path: str = DB_PATH):
+        self.path = path
+        self.db: aiosqlite.Connection | None = None
+
+    async def open(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.db = await aiosqlite.connect(self.path)
+        self.db.row_factory = aiosqlite.Row
+        await self.db.execute("PRAGMA journal_mode=WAL")
+        await self.db.executescript(SCHEMA)
+        await self.db.commit()
+
+    async def close(self):
+        if self.db is not None:
+            await self.db.close()
+            self.db = None
+
+    async def upsert_contact(self, contact_id: int, name: str):
+        await self.db.execute(
+            "INSERT INTO contacts (contact_id, name) VALUES (?, ?) "
+            "ON CONFLICT(contact_id) DO UPDATE SET name = excluded.name",
+            (contact_id, name),
+        )
+        await self.db.commit()
+
+    async def contact(self, contact_id: int) -> dict | None:
+        async with self.db.execute("SELECT * FROM contacts WHERE contact_id = ?", (contact_id,)) as cur:
+            row = await cur.fetchone()
+        return dict(row) if row else None
+
+    async def mark_backfilled(self, contact_id: int):
+        await self.db.execute("UPDATE contacts SET backfilled = 1 WHERE contact_id = ?", (contact_id,))
+        await self.db.commit()
+
+    async def id_range(self, contact_id: int) -> tuple[int | None, int | None]:
+        """Lowest and highest stored message id for a contact."""
+        async with self.db.execute(
+            "SELECT MIN(id), MAX(id) FROM messages WHERE contact_id = ?", (contact_id,)
+        ) as cur:
+            low, high = await cur.fetchone()
+        return low, high
+
+    async def add_messages(self, contact_id: int, messages) -> int:
+        """Insert or update Telethon messages; returns how many rows were written.
+
+        Writes that land at or below the newest stored id (backfills and edits)
+        bump the contact's history revision, so derived data can tell it is stale.
+        """
+        rows = [(contact_id, m.id, int(m.out), str(m.date), m.text) for m in messages]
+        if not rows:
+            return 0
+        # One statement, so a concurrent append can't slip between the check and the bump
+        await self.db.execute(
+            "INSERT INTO history_revisions (contact_id, revision) "
+            "SELECT ?, 1 WHERE EXISTS (SELECT 1 FROM messages WHERE contact_id = ? AND id >= ?) "
+            "ON CONFLICT(contact_id) DO UPDATE SET revision = revision + 1",
+            (contact_id, contact_id, min(row[1] for row in rows)),
+        )
+        await self.db.executemany(
+            "INSERT INTO messages (contact_id, id, out, date, text) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(contact_id, id) DO UPDATE SET text = excluded.text, date = excluded.date",
+            rows,
+        )
+        await self.db.commit()
+        return len(rows)
+
+    async def messages(self, contact_id: int, limit: int = 50, before_id: int | None = None) -> list[dict]:
+        """A page of messages, newest first, optionally older than `before_id`."""
+        query = "SELECT id, out, date, text FROM messages WHERE contact_id = ?"
+        params: list = [contact_id]
+        if before_id is not None:
+            query += " AND id < ?"
+            params.append(before_id)
+        query += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+
+        async with self.db.execute(query, params) as cur:
+            return [dict(row) for row in await cur.fetchall()]
+
+    async def revision(self, contact_id: int) -> int:
+        """How many times the contact's already-stored history was backfilled or edited."""
+        async with self.db.execute(
+            "SELECT revision FROM history_revisions WHERE contact_id = ?", (contact_id,)
+        ) as cur:
+            row = await cur.fetchone()
+        return row["revision"] if row else 0
+
+    async def history(self, contact_id: int, after_id: int = 0) -> list[dict]:
+        """Every stored message after `after_id`, oldest first."""
+        async with self.db.execute(
+            "SELECT id, out, date, text FROM messages WHERE contact_id = ? AND id > ? ORDER BY id",
+            (contact_id, after_id),
+        ) as cur:
+            return [dict(row) for row in await cur.fetchall()]
+
+    async def by_ids(self, contact_id: int, ids: list[int]) -> list[dict]:
+        """The given messages, oldest first."""
+        placeholders = ",".join("?" * len(ids))
+        async with self.db.execute(
+            f"SELECT id, out, date, text FROM messages WHERE contact_id = ? AND id IN ({placeholders}) ORDER BY id",
+            (contact_id, *ids),
+        ) as cur:
+            return [dict(row) for row in await cur.fetchall()]
+
+    async def iter_history(self, contact_id: int, page_size: int = 500):
+        """Stored messages oldest first, one page at a time."""
+        after_id = 0
+        while True:
+            async with self.db.execute(
+                "SELECT id, out, date, text FROM messages WHERE contact_id = ? AND id > ? ORDER BY id LIMIT ?",
+                (contact_id, after_id, page_size),
+            ) as cur:
+                page = [dict(row) for row in await cur.fetchall()]
+            if not page:
+                return
+            yield page
+            after_id = page[-1]["id"]
+
+    async def count(self, contact_id: int) -> int:
+        async with self.db.execute("SELECT COUNT(*) FROM messages WHERE contact_id = ?", (contact_id,)) as cur:
+            (total,) = await cur.fetchone()
+        return total
+
+
+async def sync_contact(client, store: MessageStore, contact_id: int, name: str, peer,
+                       backfill_pages: int = 0, page_size: int = 100) -> dict:
+    """Bring a contact's stored history up to date.
+
+    Only messages newer than the stored max id are fetched; `backfill_pages`
+    extra pages of older history are pulled from below the stored min id.
+    """
+    await store.upsert_contact(contact_id, name)
+    _, high = await store.id_range(contact_id)
+
+    with stage("telegram_iter_messages"):
+        if high is None:
+            newer = [m async for m in client.iter_messages(peer, limit=page_size)]
+        else:
+            newer = [m async for m in client.iter_messages(peer, min_id=high)]
+    added = await store.add_messages(contact_id, newer)
+    if high is None and len(newer) < page_size:
+        await store.mark_backfilled(contact_id)
+
+    backfilled = 0
+    contact = await store.contact(contact_id)
+    for _ in range(backfill_pages):
+        if contact["backfilled"]:
+            break
+        low, _ = await store.id_range(contact_id)
+        if low is None:
+            break
+        with stage("telegram_iter_messages"):
+            older = [m async for m in client.iter_messages(peer, offset_id=low, limit=page_size)]
+        backfilled += await store.add_messages(contact_id, older)
+        if len(older) < page_size:
+            await store.mark_backfilled(contact_id)
+            break
+
+    return {"new": added, "backfilled": backfilled}
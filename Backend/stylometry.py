@@ -0,0 +1,168 @@
+import json
+from collections import Counter
+
+import numpy as np
+
+from store import MessageStore
+
+EMOJI_PATTERN = r"[\U0001F300-\U0001FAFF\U0001F1E6-\U0001F1FF\u2600-\u27BF]"
+
+SLANG = frozenset({
+    "u", "ur", "r", "y", "k", "kk", "ok", "ya", "yea", "yeah", "ye", "nah", "bc", "cuz", "cus",
+    "l8r", "sm", "hw", "b4", "rn", "lol", "lmao", "lmfao", "rofl", "tru", "bet", "ty", "tysm", "thx",
+    "ily", "ilyt", "idk", "idc", "tbh", "omg", "brb", "gtg", "g2g", "pls", "plz", "nvm", "imo", "smh",
+    "wyd", "hbu", "wbu", "btw", "fr", "ngl", "dis", "dat", "da", "gonna", "wanna", "gotta", "gr8",
+    "2day", "2morrow", "2nite", "4", "2", "w/e", "jk", "ikr", "irl", "np", "af", "asap", "dm", "ttyl",
+})
+
+# Upper edges of the words-per-message histogram; the last bin is open-ended
+LENGTH_BINS = [1, 2, 3, 5, 8, 13, 21, 34]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS profiles (
+    contact_id INTEGER NOT NULL,
+    out INTEGER NOT NULL,
+    last_id INTEGER NOT NULL,
+    revision INTEGER NOT NULL,
+    stats TEXT NOT NULL,
+    PRIMARY KEY (contact_id, out)
+);
+"""
+
+COUNTS = ("messages", "chars", "chars_sq", "words", "tokens", "emoji_messages", "starts_upper", "all_lower",
+          "ends_period", "no_end_punct", "repeated_marks", "commas", "caps_words")
+TALLIES = ("slang", "number_subs", "emoji")
+
+
+def empty_stats() -> dict:
+    return {**{key: 0 for key in COUNTS}, **{key: {} for key in TALLIES},
+            "length_hist": [0] * (len(LENGTH_BINS) + 1)}
+
+
+def message_stats(texts: list[str]) -> dict:
+    """Additive typing statistics for a batch of messages, computed in vectorized passes"""
+    # Imported here so it doesn't weigh on the backend's startup
+    import pandas as pd
+
+    s = pd.Series(texts, dtype="object").dropna().astype(str).str.strip()
+    s = s[s.str.len() > 0]
+    if s.empty:
+        return empty_stats()
+
+    chars = s.str.len().to_numpy()
+    words = s.str.count(r"\S+").to_numpy()
+    tokens = s.str.lower().str.findall(r"[a-z0-9/']+").explode().dropna()
+    emojis = s.str.findall(EMOJI_PATTERN).explode().dropna()
+    has_letters = s.str.contains(r"[A-Za-z]")
+
+    slang = tokens[tokens.isin(SLANG)]
+    # Letters and 2/4/8 mixed in one token, e.g. "b4", "l8r", "2day"
+    number_subs = tokens[tokens.str.fullmatch(r"(?=.*[a-z])(?=.*[248])[a-z248]+")]
+
+    return {
+        "messages": int(len(s)),
+        "chars": int(chars.sum()),
+        "chars_sq": int((chars.astype(np.int64) ** 2).sum()),
+        "words": int(words.sum()),
+        "tokens": int(len(tokens)),
+        "emoji_messages": int(s.str.contains(EMOJI_PATTERN).sum()),
+        "starts_upper": int(s.str.match(r"[A-Z]").sum()),
+        "all_lower": int(((s == s.str.lower()) & has_letters).sum()),
+        "ends_period": int(s.str.contains(r"\.$").sum()),
+        "no_end_punct": int((~s.str.contains(r"[.?!]$")).sum()),
+        "repeated_marks": int(s.str.contains(r"[?!]{2,}").sum()),
+        "commas": int(s.str.count(",").sum()),
+        "caps_words": int(s.str.count(r"\b[A-Z]{2,}\b").sum()),
+        "slang": slang.value_counts().to_dict(),
+        "number_subs": number_subs.value_counts().to_dict(),
+        "emoji": emojis.value_counts().to_dict(),
+        "length_hist": np.bincount(np.searchsorted(LENGTH_BINS, words), minlength=len(LENGTH_BINS) + 1).tolist(),
+    }
+
+
+def merge_stats(a: dict, b: dict) -> dict:
+    merged = {key: a[key] + b[key] for key in COUNTS}
+    for key in TALLIES:
+        merged[key] = dict(Counter(a[key]) + Counter(b[key]))
+    merged["length_hist"] = [x + y for x, y in zip(a["length_hist"], b["length_hist"])]
+    return merged
+
+
+def _share(count: int, total: int) -> str:
+    return f"{100 * count / total:.0f}%" if total else "0%"
+
+
+def _top(tally: dict, n: int) -> list[str]:
+    return [item for item, _ in Counter(tally).most_common(n)]
+
+
+def render_profile(stats: dict, name: str) -> str:
+    """Markdown profile block for the suggestion prompt"""
+    total = stats["messages"]
+    if not total:
+        return f"### **User Typing Behavior Profile ({name}):**\n* No messages yet; use a neutral, casual tone."
+
+    mean_chars = stats["chars"] / total
+    std_chars = max(stats["chars_sq"] / total - mean_chars ** 2, 0) ** 0.5
+    cumulative = np.cumsum(stats["length_hist"])
+    median_bin = int(np.searchsorted(cumulative, total / 2))
+    median_words = f"{LENGTH_BINS[median_bin]} or fewer" if median_bin < len(LENGTH_BINS) else f"over {LENGTH_BINS[-1]}"
+
+    slang_total = sum(stats["slang"].values())
+    lines = [
+        f"### **User Typing Behavior Profile ({name} - computed from {total} messages):**",
+        f"* **Message Length:** {stats['words'] / total:.1f} words on average (median {median_words}), "
+        f"{mean_chars:.0f} ± {std_chars:.0f} characters.",
+        f"* **Abbreviations & Slang:** {_share(slang_total, stats['tokens'])} of words are slang or abbreviations"
+        + (f"; most used: {', '.join(_top(stats['slang'], 10))}." if slang_total else "."),
+        "* **Number-for-Letter Substitution:** "
+        + (f"uses {', '.join(_top(stats['number_subs'], 8))}." if stats["number_subs"] else "none observed."),
+        f"* **Emoji Usage:** emojis in {_share(stats['emoji_messages'], total)} of messages"
+        + (f"; favourites: {' '.join(_top(stats['emoji'], 6))}." if stats["emoji"] else "."),
+        f"* **Capitalization:** {_share(stats['starts_upper'], total)} of messages start with a capital letter, "
+        f"{_share(stats['all_lower'], total)} are all lowercase, {stats['caps_words'] / total:.2f} ALL-CAPS words per message.",
+        f"* **Punctuation:** {_share(stats['no_end_punct'], total)} of messages have no closing punctuation, "
+        f"{_share(stats['ends_period'], total)} end with a period, "
+        f"{_share(stats['repeated_marks'], total)} use repeated ?/!, {stats['commas'] / total:.2f} commas per message.",
+    ]
+    return "\n".join(lines)
+
+
+class ProfileStore:
+    """Per-contact typing profiles kept as additive statistics in the message store.
+
+    Each refresh only folds in messages newer than the last one profiled. If
+    the store's history revision moved since (older messages were backfilled
+    or profiled ones edited), the profile is recomputed from the full history.
+    """
+
+    def __init__(self, store: MessageStore):
+        self.store = store
+
+    async def open(self):
+        await self.store.db.executescript(SCHEMA)
+        await self.store.db.commit()
+
+    async def refresh(self, contact_id: int, out: bool = True) -> dict:
+        # Read before the history, so a backfill that lands in between is caught next time
+        revision = await self.store.revision(contact_id)
+        async with self.store.db.execute(
+            "SELECT last_id, revision, stats FROM profiles WHERE contact_id = ? AND out = ?", (contact_id, int(out))
+        ) as cur:
+            row = await cur.fetchone()
+        current = row is not None and row["revision"] == revision
+        last_id, stats = (row["last_id"], json.loads(row["stats"])) if current else (0, empty_stats())
+
+        new = [m for m in await self.store.history(contact_id, after_id=last_id) if bool(m["out"]) == out]
+        if not new and current:
+            return stats
+
+        if new:
+            stats = merge_stats(stats, message_stats([m["text"] for m in new]))
+            last_id = new[-1]["id"]
+        await self.store.db.execute(
+            "INSERT OR REPLACE INTO profiles (contact_id, out, last_id, revision, stats) VALUES (?, ?, ?, ?, ?)",
+            (contact_id, int(out), last_id, revision, json.dumps(stats, ensure_ascii=False)),
+        )
+        await self.store.db.commit()
+        return stats
@@ -0,0 +1,108 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+
+from telethon import TelegramClient
+from telethon.errors import FloodWaitError
+
+from metrics import stage
+
+api_id = os.getenv('TELEGRAM_API_ID')
+api_hash = os.getenv('TELEGRAM_API_HASH')
+
+# Comma-separated session files, all logged in to the same account
+SESSIONS = [s.strip() for s in os.getenv('TELEGRAM_SESSIONS', 'name').split(',') if s.strip()]
+
+
+class ClientPool:
+    """Long-lived TelegramClients shared across requests, one per session file.
+
+    Clients are connected once and handed out to the least busy session that
+    is not sitting out a FloodWait, so parallel fetches spread across sessions.
+    """
+
+    def __init__(self, sessions: list[str] = SESSIONS, api_id=api_id, api_hash=api_hash,
+                 client_factory=TelegramClient):
+        self.sessions = sessions
+        self.api_id = api_id
+        self.api_hash = api_hash
+        # Called as client_factory(session, api_id, api_hash); the benchmark swaps in a fake
+        self.client_factory = client_factory
+        self.clients: list[TelegramClient] = []
+        self.me = None
+        self._busy: list[int] = []
+        self._blocked_until: list[float] = []
+        self._released = asyncio.Event()
+
+    @property
+    def primary(self) -> TelegramClient:
+        return self.clients[0]
+
+    async def start(self):
+        # Safe to call again after a failed start; clients from the earlier attempt are dropped
+        await self.stop()
+        for session in self.sessions:
+            client = self.client_factory(session, self.api_id, self.api_hash)
+            with stage("telegram_connect"):
+                await client.connect()
+            if not await client.is_user_authorized():
+                print(f"Session '{session}' is not authorized, skipping")
+                await client.disconnect()
+                continue
+            self.clients.append(client)
+
+        if not self.clients:
+            raise RuntimeError("No authorized Telegram sessions available")
+
+        self._busy = [0] * len(self.clients)
+        self._blocked_until = [0.0] * len(self.clients)
+        self.me = await self.primary.get_me()
+
+    async def stop(self):
+        await asyncio.gather(*(c.disconnect() for c in self.clients), return_exceptions=True)
+        self.clients = []
+
+    def sender_name(self) -> str:
+        return f"{self.me.first_name} {self.me.last_name or ''}".strip()
+
+    def block(self, client: TelegramClient, seconds: float):
+        """Keep a session out of rotation until its FloodWait expires."""
+        slot = self.clients.index(client)
+        self._blocked_until[slot] = max(self._blocked_until[slot], time.monotonic() + seconds)
+
+    def _pick(self) -> int | None:
+        now = time.monotonic()
+        free = [i for i, until in enumerate(self._blocked_until) if until <= now]
+        if not free:
+            return None
+        return min(free, key=lambda i: self._busy[i])
+
+    @asynccontextmanager
+    async def acquire(self):
+        while (slot := self._pick()) is None:
+            wait = min(self._blocked_until) - time.monotonic()
+            self._released.clear()
+            try:
+                await asyncio.wait_for(self._released.wait(), timeout=max(wait, 0))
+            except asyncio.TimeoutError:
+                pass
+
+        self._busy[slot] += 1
+        try:
+            yield self.clients[slot]
+        finally:
+            self._busy[slot] -= 1
+            self._released.set()
+
+    async def run(self, job, retries: int = 3):
+        """Run `job(client)` on a pooled client, moving to another session on FloodWait."""
+        for attempt in range(retries + 1):
+            async with self.acquire() as client:
+                try:
+                    return await job(client)
+                except FloodWaitError as e:
+                    print(f"FloodWait of {e.seconds}s on session {self.clients.index(client)}")
+                    self.block(client, e.seconds)
+                    if attempt == retries:
+                        raise
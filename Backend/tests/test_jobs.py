@@ -0,0 +1,85 @@
+import asyncio
+
+from jobs import JobQueue
+from store import MessageStore
+
+
+async def slow_job(contact_id):
+    await asyncio.sleep(0.2)
+    return {"contact_id": contact_id}
+
+
+def run_with_queue(tmp_path, scenario, job=slow_job):
+    async def main():
+        store = MessageStore(str(tmp_path / "messages.db"))
+        await store.open()
+        queue = JobQueue(store, {"generate": job, "suggestion": job}, workers=1)
+        await queue.open()
+        try:
+            return await scenario(queue)
+        finally:
+            await queue.close()
+            await store.close()
+
+    return asyncio.run(main())
+
+
+def test_concurrent_submits_share_one_job(tmp_path):
+    async def scenario(queue):
+        return await asyncio.gather(*(queue.submit("generate", 42) for _ in range(5)))
+
+    submitted = run_with_queue(tmp_path, scenario)
+    assert len({job["id"] for job, _ in submitted}) == 1
+    assert sorted(deduplicated for _, deduplicated in submitted) == [False, True, True, True, True]
+
+
+def test_other_contacts_and_kinds_are_not_deduplicated(tmp_path):
+    async def scenario(queue):
+        return await asyncio.gather(queue.submit("generate", 1), queue.submit("generate", 2),
+                                    queue.submit("suggestion", 1))
+
+    submitted = run_with_queue(tmp_path, scenario)
+    assert len({job["id"] for job, _ in submitted}) == 3
+    assert not any(deduplicated for _, deduplicated in submitted)
+
+
+def test_finished_job_allows_a_new_submit(tmp_path):
+    async def scenario(queue):
+        first, _ = await queue.submit("generate", 7)
+        while (await queue.get(first["id"]))["status"] != "done":
+            await asyncio.sleep(0.05)
+        second, deduplicated = await queue.submit("generate", 7)
+        return first, second, deduplicated
+
+    first, second, deduplicated = run_with_queue(tmp_path, scenario)
+    assert second["id"] != first["id"] and not deduplicated
+
+
+def test_cancel_before_the_worker_claims_the_job(tmp_path):
+    started = []
+
+    async def recorded_job(contact_id):
+        started.append(contact_id)
+        return await slow_job(contact_id)
+
+    async def scenario(queue):
+        read = queue.get
+
+        async def slow_read(job_id):
+            # Widen the gap between the worker seeing the job queued and marking it running
+            job = await read(job_id)
+            if asyncio.current_task() in queue._workers:
+                await asyncio.sleep(0.05)
+            return job
+
+        queue.get = slow_read
+        job, _ = await queue.submit("generate", 3)
+        await asyncio.sleep(0.01)
+        cancelled = await queue.cancel(job["id"])
+        await asyncio.sleep(0.3)
+        return cancelled, await queue.get(job["id"])
+
+    cancelled, final = run_with_queue(tmp_path, scenario, job=recorded_job)
+    assert cancelled["status"] == "cancelled"
+    assert final["status"] == "cancelled"
+    assert started == []
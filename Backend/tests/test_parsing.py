@@ -0,0 +1,36 @@
+from chatInference import parse_emotion, parse_emotion_batch
+
+
+def test_single_reply_with_trailing_brackets():
+    reply = ('[{"analysis": "Happy news", "dim": "joy", "score": 8}]\n'
+             'Note: format [{"dim": ..., "score": ...}]')
+    emotion = parse_emotion(reply)
+    assert emotion is not None
+    assert (emotion["dim"], emotion["score"]) == ("joy", 8.0)
+
+
+def test_single_reply_in_a_code_fence():
+    emotion = parse_emotion('```json\n[ {"analysis": "meh", "dim": "Neutral", "score": 5} ]\n```')
+    assert emotion is not None and emotion["dim"] == "neutral"
+
+
+def test_single_reply_without_json():
+    assert parse_emotion("Sorry, I cannot classify that.") is None
+
+
+def test_batch_reply_maps_items_by_index():
+    reply = ('[{"index": 1, "analysis": "b", "dim": "anger", "score": 7},\n'
+             ' {"index": 0, "analysis": "a", "dim": "joy", "score": 6},\n'
+             ' {"index": 2, "analysis": "c", "dim": "not-an-emotion", "score": 1}]')
+    emotions = parse_emotion_batch(reply, 3)
+    assert [e and e["dim"] for e in emotions] == ["joy", "anger", None]
+
+
+def test_batch_reply_with_trailing_text():
+    reply = ('[{"index": 0, "analysis": "a", "dim": "joy", "score": 6},'
+             ' {"index": 1, "analysis": "b", "dim": "fear", "score": 4}]\nHope this helps!')
+    assert [e and e["dim"] for e in parse_emotion_batch(reply, 2)] == ["joy", "fear"]
+
+
+def test_malformed_batch_reply_leaves_every_position_empty():
+    assert parse_emotion_batch("no json here", 2) == [None, None]
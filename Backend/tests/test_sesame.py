@@ -0,0 +1,68 @@
+import numpy as np
+
+from sesame import JitterBuffer, Resampler, RingBuffer
+
+
+def read(buffer: RingBuffer, n: int) -> np.ndarray:
+    out = np.zeros(n, dtype=np.int16)
+    return out[:buffer.read_into(out)]
+
+
+def test_ring_buffer_wraps_around():
+    buffer = RingBuffer(8)
+    buffer.write(np.arange(6, dtype=np.int16))
+    assert read(buffer, 4).tolist() == [0, 1, 2, 3]
+
+    # Starts at slot 6 and continues from slot 0
+    buffer.write(np.arange(6, 12, dtype=np.int16))
+    assert len(buffer) == 8
+    assert read(buffer, 10).tolist() == [4, 5, 6, 7, 8, 9, 10, 11]
+    assert buffer.overruns == 0
+
+
+def test_ring_buffer_overrun_drops_the_oldest_samples():
+    buffer = RingBuffer(8)
+    buffer.write(np.arange(6, dtype=np.int16))
+    buffer.write(np.arange(6, 10, dtype=np.int16))
+    assert buffer.overruns == 1
+    assert read(buffer, 8).tolist() == [2, 3, 4, 5, 6, 7, 8, 9]
+
+    buffer.write(np.arange(20, dtype=np.int16))
+    assert read(buffer, 8).tolist() == list(range(12, 20))
+
+
+def test_jitter_buffer_waits_for_its_target_and_rebuffers_after_an_underrun():
+    buffer = JitterBuffer(16, target=4)
+    frame = np.zeros(3, dtype=np.int16)
+    buffer.write(np.array([1, 2, 3], dtype=np.int16))
+    assert not buffer.read_frame(frame) and frame.tolist() == [0, 0, 0]
+
+    buffer.write(np.array([4, 5], dtype=np.int16))
+    assert buffer.read_frame(frame) and frame.tolist() == [1, 2, 3]
+    assert buffer.read_frame(frame) and frame.tolist() == [4, 5, 0]
+    assert buffer.underruns == 1
+    assert not buffer.read_frame(frame)
+
+
+def test_resampler_is_continuous_across_chunks():
+    signal = (np.sin(np.arange(4000) / 7) * 10000).astype(np.int16)
+    whole = Resampler(24000, 16000, max_input=len(signal)).process(signal).copy()
+
+    chunked = Resampler(24000, 16000, max_input=1024)
+    pieces = [chunked.process(signal[start:start + 500]).copy() for start in range(0, len(signal), 500)]
+    assert np.array_equal(np.concatenate(pieces), whole)
+
+
+def test_resampler_handles_chunks_shorter_than_a_step():
+    signal = np.arange(0, 3000, 10, dtype=np.int16)
+    whole = Resampler(48000, 16000, max_input=len(signal)).process(signal).copy()
+
+    chunked = Resampler(48000, 16000, max_input=8)
+    pieces = [chunked.process(signal[i:i + 2]).copy() for i in range(0, len(signal), 2)]
+    assert np.array_equal(np.concatenate(pieces), whole)
+
+
+def test_resampler_output_length_follows_the_rate_ratio():
+    resampler = Resampler(16000, 24000, max_input=1600)
+    total = sum(len(resampler.process(np.zeros(1600, dtype=np.int16))) for _ in range(10))
+    assert abs(total - 24000) <= 1
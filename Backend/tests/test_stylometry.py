@@ -0,0 +1,74 @@
+import asyncio
+from types import SimpleNamespace
+
+from store import MessageStore
+from stylometry import ProfileStore, message_stats
+
+TEXTS = ["hey how r u", "Omg that's AMAZING!!", "ok", "see u l8r 😂", "I'll call you tomorrow.",
+         "lol", "nah, b4 lunch", "What time?", "idk tbh", "sounds good 👍"]
+
+
+def message(message_id: int, text: str, out: bool = True) -> SimpleNamespace:
+    return SimpleNamespace(id=message_id, out=out, date="2024-01-01 00:00:00+00:00", text=text)
+
+
+def run_with_profiles(tmp_path, scenario):
+    async def main():
+        store = MessageStore(str(tmp_path / "messages.db"))
+        await store.open()
+        profiles = ProfileStore(store)
+        await profiles.open()
+        try:
+            return await scenario(store, profiles)
+        finally:
+            await store.close()
+
+    return asyncio.run(main())
+
+
+async def full_stats(store: MessageStore, contact_id: int) -> dict:
+    return message_stats([m["text"] for m in await store.history(contact_id) if m["out"]])
+
+
+def test_incremental_refresh_matches_a_full_recompute(tmp_path):
+    async def scenario(store, profiles):
+        await store.add_messages(1, [message(100 + i, text, out=i % 3 != 0) for i, text in enumerate(TEXTS)])
+        await profiles.refresh(1)
+        await store.add_messages(1, [message(200 + i, text) for i, text in enumerate(TEXTS[:4])])
+        return await profiles.refresh(1), await full_stats(store, 1)
+
+    incremental, full = run_with_profiles(tmp_path, scenario)
+    assert incremental == full
+
+
+def test_backfilled_history_is_folded_in(tmp_path):
+    async def scenario(store, profiles):
+        await store.add_messages(1, [message(100 + i, text) for i, text in enumerate(TEXTS[:5])])
+        before = await profiles.refresh(1)
+        # Older messages arrive after the profile was built
+        await store.add_messages(1, [message(10 + i, text) for i, text in enumerate(TEXTS[5:])])
+        return before, await profiles.refresh(1), await full_stats(store, 1)
+
+    before, after, full = run_with_profiles(tmp_path, scenario)
+    assert before["messages"] == 5
+    assert after == full and after["messages"] == len(TEXTS)
+
+
+def test_edited_messages_are_recounted(tmp_path):
+    async def scenario(store, profiles):
+        await store.add_messages(1, [message(100 + i, text) for i, text in enumerate(TEXTS)])
+        await profiles.refresh(1)
+        await store.add_messages(1, [message(100, "HEY HOW ARE YOU")])
+        return await profiles.refresh(1), await full_stats(store, 1)
+
+    after, full = run_with_profiles(tmp_path, scenario)
+    assert after == full
+
+
+def test_refresh_without_changes_returns_the_stored_profile(tmp_path):
+    async def scenario(store, profiles):
+        await store.add_messages(1, [message(100 + i, text) for i, text in enumerate(TEXTS)])
+        return await profiles.refresh(1), await profiles.refresh(1)
+
+    first, second = run_with_profiles(tmp_path, scenario)
+    assert first == second
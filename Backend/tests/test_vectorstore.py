@@ -0,0 +1,100 @@
+import json
+import os
+
+import numpy as np
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores import ExactMatchFilter, MetadataFilters, VectorStoreQuery
+
+from vectorstore import META_FILE, VECTORS_FILE, MmapVectorStore
+
+DIM = 4
+
+
+def node(node_id: str, contact_id: int, embedding: list[float], text: str = "") -> TextNode:
+    return TextNode(id_=node_id, text=text or node_id, metadata={"contact_id": contact_id}, embedding=embedding)
+
+
+def query(store: MmapVectorStore, embedding: list[float], contact_id: int | None = None, k: int = 10):
+    filters = None
+    if contact_id is not None:
+        filters = MetadataFilters(filters=[ExactMatchFilter(key="contact_id", value=contact_id)])
+    return store.query(VectorStoreQuery(query_embedding=embedding, similarity_top_k=k, filters=filters))
+
+
+def test_deleted_id_can_be_added_again(tmp_path):
+    store = MmapVectorStore(str(tmp_path), dim=DIM)
+    store.add([node("a", 1, [1, 0, 0, 0], "old"), node("b", 1, [0, 1, 0, 0])])
+    store.delete_nodes(["a"])
+    store.add([node("a", 1, [0, 0, 1, 0], "new")])
+
+    fresh = MmapVectorStore(str(tmp_path), dim=DIM)
+    assert fresh.stored_hashes(["a", "b"], 1).keys() == {"a", "b"}
+    result = query(fresh, [0, 0, 1, 0], contact_id=1)
+    assert result.ids == ["a", "b"]
+    assert result.nodes[0].get_content() == "new"
+    assert result.similarities[0] > 0.99
+
+
+def test_adding_a_live_id_again_is_a_no_op(tmp_path):
+    store = MmapVectorStore(str(tmp_path), dim=DIM)
+    store.add([node("a", 1, [1, 0, 0, 0])])
+    store.add([node("a", 1, [0, 1, 0, 0])])
+
+    with open(tmp_path / "1" / META_FILE, encoding="utf-8") as f:
+        assert len(f.readlines()) == 1
+
+
+def test_torn_sidecar_line_is_ignored_then_repaired(tmp_path):
+    store = MmapVectorStore(str(tmp_path), dim=DIM)
+    store.add([node("a", 1, [1, 0, 0, 0])])
+    meta = tmp_path / "1" / META_FILE
+    with open(meta, "ab") as f:
+        f.write(b'{"id": "torn", "metadata": {"contact_id"')
+
+    reader = MmapVectorStore(str(tmp_path), dim=DIM)
+    assert query(reader, [1, 0, 0, 0], contact_id=1).ids == ["a"]
+
+    store.add([node("b", 1, [0, 1, 0, 0])])
+    with open(meta, encoding="utf-8") as f:
+        assert [json.loads(line)["id"] for line in f] == ["a", "b"]
+    assert query(MmapVectorStore(str(tmp_path), dim=DIM), [0, 1, 0, 0], contact_id=1).ids == ["b", "a"]
+
+
+def test_vectors_past_the_sidecar_are_overwritten(tmp_path):
+    store = MmapVectorStore(str(tmp_path), dim=DIM)
+    store.add([node("a", 1, [1, 0, 0, 0])])
+    # A writer that died after writing its vectors but before the sidecar line
+    with open(tmp_path / "1" / VECTORS_FILE, "ab") as f:
+        f.write(np.full((3, DIM), 9, dtype=np.float32).tobytes())
+
+    store.add([node("b", 1, [0, 1, 0, 0])])
+    assert os.path.getsize(tmp_path / "1" / VECTORS_FILE) == 2 * DIM * 4
+    result = query(MmapVectorStore(str(tmp_path), dim=DIM), [0, 1, 0, 0], contact_id=1)
+    assert result.ids == ["b", "a"]
+    assert result.similarities[0] > 0.99
+
+
+def test_filtered_top_k_order(tmp_path):
+    store = MmapVectorStore(str(tmp_path), dim=DIM)
+    store.add([
+        node("near", 1, [1, 0.1, 0, 0]),
+        node("far", 1, [0, 0, 1, 0]),
+        node("mid", 1, [1, 1, 0, 0]),
+        node("other", 2, [1, 0, 0, 0]),
+    ])
+
+    result = query(store, [1, 0, 0, 0], contact_id=1, k=2)
+    assert result.ids == ["near", "mid"]
+    assert result.similarities == sorted(result.similarities, reverse=True)
+    assert query(store, [1, 0, 0, 0], k=2).ids == ["other", "near"]
+
+
+def test_reader_sees_rows_appended_by_another_instance(tmp_path):
+    reader = MmapVectorStore(str(tmp_path), dim=DIM)
+    writer = MmapVectorStore(str(tmp_path), dim=DIM)
+    writer.add([node("a", 1, [1, 0, 0, 0])])
+    assert query(reader, [1, 0, 0, 0], contact_id=1).ids == ["a"]
+
+    writer.add([node("b", 1, [0, 1, 0, 0])])
+    writer.delete_nodes(["a"])
+    assert query(reader, [1, 0, 0, 0], contact_id=1).ids == ["b"]
@@ -0,0 +1,296 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Sequence
+
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    FilterOperator,
+    MetadataFilters,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+from llama_index.core.vector_stores.utils import metadata_dict_to_node, node_to_metadata_dict
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-writer only
+    fcntl = None
+
+PARTITION_KEY = "contact_id"
+VECTORS_FILE = "vectors.f32"
+META_FILE = "meta.jsonl"
+
+
+class Partition:
+    """Embeddings of one contact: an append-only float32 matrix plus a JSON-lines sidecar.
+
+    Row i of `vectors.f32` belongs to the i-th node line of `meta.jsonl`.
+    Writers add the vectors before the metadata line, so any row a reader can
+    see in the sidecar already has its vector. Deletes are tombstone lines, and a
+    deleted id can be added again as a new row.
+    Vectors are stored L2-normalized, so cosine similarity is a dot product.
+    """
+
+    def __init__(self, directory: str, dim: int):
+        self.directory = directory
+        self.dim = dim
+        self.ids: list[str] = []
+        self.rows: list[dict] = []
+        self.index: dict[str, int] = {}
+        self.alive = np.zeros(0, dtype=bool)
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self._offset = 0
+        self._mapped = 0
+        self._lock = threading.Lock()
+
+    @property
+    def meta_path(self) -> str:
+        return os.path.join(self.directory, META_FILE)
+
+    @property
+    def vectors_path(self) -> str:
+        return os.path.join(self.directory, VECTORS_FILE)
+
+    def refresh(self):
+        """Pick up rows and tombstones written since the last call, by this or another process"""
+        with self._lock:
+            try:
+                size = os.path.getsize(self.meta_path)
+            except FileNotFoundError:
+                return
+            if size <= self._offset:
+                return
+
+            with open(self.meta_path, "rb") as f:
+                f.seek(self._offset)
+                chunk = f.read(size - self._offset)
+            # A line still being written has no newline yet; leave it for the next refresh
+            complete = chunk[:chunk.rfind(b"\n") + 1]
+            self._offset += len(complete)
+
+            alive = list(self.alive)
+            for line in complete.splitlines():
+                entry = json.loads(line)
+                if "delete" in entry:
+                    for node_id in entry["delete"]:
+                        if node_id in self.index:
+                            alive[self.index[node_id]] = False
+                    continue
+                self.index[entry["id"]] = len(self.ids)
+                self.ids.append(entry["id"])
+                self.rows.append(entry["metadata"])
+                alive.append(True)
+
+            if len(self.ids) != self._mapped:
+                self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(len(self.ids), self.dim))
+                self._mapped = len(self.ids)
+            self.alive = np.array(alive, dtype=bool)
+
+    def live(self, node_id: str) -> bool:
+        row = self.index.get(node_id)
+        return row is not None and bool(self.alive[row])
+
+    def repair(self):
+        """Cut a torn last line left by a writer that died mid-append; the caller holds the file lock"""
+        try:
+            f = open(self.meta_path, "r+b")
+        except FileNotFoundError:
+            return
+        with f:
+            end = f.seek(0, os.SEEK_END)
+            position = end
+            while position > 0:
+                start = max(0, position - 65536)
+                f.seek(start)
+                block = f.read(position - start)
+                newline = block.rfind(b"\n")
+                if newline >= 0:
+                    position = start + newline + 1
+                    break
+                position = start
+            if position < end:
+                f.truncate(position)
+
+    def append(self, ids: list[str], vectors: np.ndarray, rows: list[dict]):
+        """Write new rows; the caller holds the partition's file lock and has refreshed"""
+        os.makedirs(self.directory, exist_ok=True)
+        mode = "r+b" if os.path.exists(self.vectors_path) else "wb"
+        with open(self.vectors_path, mode) as f:
+            # Anything past the rows the sidecar knows about is left over from an interrupted write
+            f.seek(len(self.ids) * self.dim * 4)
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+            f.truncate()
+        with open(self.meta_path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps({"id": i, "metadata": row}, ensure_ascii=False) + "\n"
+                            for i, row in zip(ids, rows)))
+
+    def tombstone(self, ids: list[str]):
+        with open(self.meta_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"delete": ids}) + "\n")
+
+    def search(self, query: np.ndarray, k: int, mask: np.ndarray | None = None) -> list[tuple[float, int]]:
+        # Another thread may be refreshing; search the rows both snapshots cover
+        vectors, alive = self.vectors, self.alive
+        n = min(len(vectors), len(alive))
+        alive = alive[:n] if mask is None else alive[:n] & mask[:n]
+        if not alive.any():
+            return []
+        scores = np.asarray(vectors[:n] @ query)
+        scores[~alive] = -np.inf
+        k = min(k, int(alive.sum()))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), int(i)) for i in top]
+
+
+class MmapVectorStore(BasePydanticVectorStore):
+    """Vector store that keeps each contact's embeddings in its own memory-mapped file.
+
+    Any number of processes can query the same directory at once; they only
+    map the files and re-read the sidecar tail when it grows. Writers
+    serialize per contact with an flock, so several uvicorn workers can share
+    one store. Queries filtered on contact_id only touch that contact's files.
+    """
+
+    stores_text: bool = True
+    flat_metadata: bool = False
+    path: str
+    dim: int
+
+    _partitions: dict = PrivateAttr(default_factory=dict)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def __init__(self, path: str, dim: int = 768, **kwargs: Any):
+        super().__init__(path=path, dim=dim, **kwargs)
+        os.makedirs(path, exist_ok=True)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "MmapVectorStore"
+
+    @property
+    def client(self) -> None:
+        return None
+
+    def _partition(self, contact_id) -> Partition:
+        name = str(contact_id)
+        with self._lock:
+            if name not in self._partitions:
+                self._partitions[name] = Partition(os.path.join(self.path, name), self.dim)
+            partition = self._partitions[name]
+        partition.refresh()
+        return partition
+
+    def _all_partitions(self) -> list[Partition]:
+        names = sorted(entry.name for entry in os.scandir(self.path) if entry.is_dir())
+        return [self._partition(name) for name in names]
+
+    @contextmanager
+    def _writing(self, partition: Partition):
+        os.makedirs(partition.directory, exist_ok=True)
+        with open(os.path.join(partition.directory, ".lock"), "w") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                partition.repair()
+                partition.refresh()
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+        partition.refresh()
+
+    def add(self, nodes: Sequence[BaseNode], **kwargs: Any) -> list[str]:
+        groups: dict[str, list[BaseNode]] = {}
+        for node in nodes:
+            groups.setdefault(str(node.metadata.get(PARTITION_KEY)), []).append(node)
+
+        for contact_id, group in groups.items():
+            partition = self._partition(contact_id)
+            with self._writing(partition):
+                # Another worker may have written the same node meanwhile; deleted ids can be added back
+                fresh = {node.node_id: node for node in group if not partition.live(node.node_id)}
+                if not fresh:
+                    continue
+                vectors = np.array([node.get_embedding() for node in fresh.values()], dtype=np.float32)
+                if vectors.shape[1] != self.dim:
+                    raise ValueError(f"Expected {self.dim}-dim embeddings, got {vectors.shape[1]}")
+                norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+                vectors /= np.where(norms == 0, 1, norms)
+                rows = [node_to_metadata_dict(node, remove_text=False, flat_metadata=self.flat_metadata)
+                        for node in fresh.values()]
+                partition.append(list(fresh), vectors, rows)
+        return [node.node_id for node in nodes]
+
+    def stored_hashes(self, ids: list[str], contact_id=None) -> dict[str, str | None]:
+        """content_hash metadata of the live nodes among `ids`"""
+        partition = self._partition(contact_id)
+        return {node_id: partition.rows[partition.index[node_id]].get("content_hash")
+                for node_id in ids if partition.live(node_id)}
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        for partition in self._all_partitions():
+            ids = [partition.ids[i] for i, row in enumerate(partition.rows)
+                   if row.get("ref_doc_id") == ref_doc_id and partition.alive[i]]
+            if ids:
+                with self._writing(partition):
+                    partition.tombstone(ids)
+
+    def delete_nodes(self, node_ids: list[str] | None = None, filters: MetadataFilters | None = None,
+                     **delete_kwargs: Any) -> None:
+        if filters is not None:
+            raise NotImplementedError("MmapVectorStore only deletes by node id")
+        wanted = set(node_ids or [])
+        for partition in self._all_partitions():
+            ids = [node_id for node_id in wanted if partition.live(node_id)]
+            if ids:
+                with self._writing(partition):
+                    partition.tombstone(ids)
+
+    def _select(self, filters: MetadataFilters | None) -> tuple[list[Partition], list]:
+        """Partitions to search, and the filters left to apply row by row"""
+        if filters is None:
+            return self._all_partitions(), []
+        if len(filters.filters) > 1 and filters.condition != "and":
+            raise NotImplementedError("MmapVectorStore combines filters with AND only")
+        rest = []
+        partitions = None
+        for f in filters.filters:
+            if isinstance(f, MetadataFilters) or f.operator != FilterOperator.EQ:
+                raise NotImplementedError("MmapVectorStore supports only flat equality filters")
+            if f.key == PARTITION_KEY:
+                partitions = [self._partition(f.value)]
+            else:
+                rest.append(f)
+        return (partitions if partitions is not None else self._all_partitions()), rest
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if query.query_embedding is None:
+            raise ValueError("MmapVectorStore needs a query embedding")
+        q = np.asarray(query.query_embedding, dtype=np.float32)
+        q /= np.linalg.norm(q) or 1.0
+
+        partitions, rest = self._select(query.filters)
+        hits = []
+        for partition in partitions:
+            mask = None
+            if rest or query.node_ids:
+                wanted = set(query.node_ids or [])
+                mask = np.array([
+                    all(row.get(f.key) == f.value for f in rest) and (not wanted or partition.ids[i] in wanted)
+                    for i, row in enumerate(partition.rows)
+                ], dtype=bool)
+            hits.extend((score, partition, i) for score, i in partition.search(q, query.similarity_top_k, mask))
+
+        hits.sort(key=lambda hit: -hit[0])
+        hits = hits[:query.similarity_top_k]
+        return VectorStoreQueryResult(
+            nodes=[metadata_dict_to_node(partition.rows[i]) for _, partition, i in hits],
+            similarities=[score for score, _, _ in hits],
+            ids=[partition.ids[i] for _, partition, i in hits],
+        )